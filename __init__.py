@@ -1,28 +1,36 @@
-import functools
+import logging
 import os
-from threading import Event
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Event, Lock
+from weakref import WeakKeyDictionary
 from typing import Optional, Union, Dict, Any
 
-from BaseClasses import ItemClassification, Region, CollectionState, MultiWorld
+from BaseClasses import ItemClassification, Region, CollectionState, MultiWorld, Item
 from Options import PerGameCommonOptions
 from worlds.AutoWorld import WebWorld, World
 
 from .client import CliffReduxSNIClient
 from .location import name_to_id as _loc_name_to_id, CliffReduxLocation
 from .item import name_to_id as _item_name_to_id, CliffReduxItem, names_for_item_pool
-from .logic import cs_to_loadout, can_win
+from .logic import area_graph
+from .rules import PlayerRules, area_key, completion_key, location_key, rule_table
 from .options import make_cliff_game
 
+from .cliff_redux_randomizer import instrumentation
 from .cliff_redux_randomizer.game import Game as CliffGame
-from .cliff_redux_randomizer.defaultLogic import location_logic
 from .cliff_redux_randomizer.item import Items
 
-from .patch_utils import ItemRomData, GenData, make_gen_data
-from .rom import CliffReduxDeltaPatch
+from .patch_utils import ItemRomData, GenData, LocationIndex, make_gen_data
+from .rom import CliffReduxDeltaPatch, make_seed_ips
 
 _ = CliffReduxSNIClient  # load the module to register the handler
 
 
+_output_futures: "WeakKeyDictionary[MultiWorld, Dict[int, Future[None]]]" = WeakKeyDictionary()
+""" the output of every Cliffhanger Redux slot in a multiworld, started together """
+_output_futures_lock = Lock()
+
+
 class CliffReduxWebWorld(WebWorld):
     theme = "ice"
 
@@ -46,17 +54,20 @@ class CliffReduxWorld(World):
 
     cliff_game: Optional[CliffGame] = None
 
+    rules: PlayerRules
+
     def __init__(self, multiworld: MultiWorld, player: int):
         super().__init__(multiworld, player)
         self.rom_name = b""
         self.rom_name_available_event = Event()
+        self.rules = PlayerRules(rule_table, player)
 
     def create_item(self, name: str) -> CliffReduxItem:
         return CliffReduxItem(name, self.player)
 
     def generate_early(self) -> None:
         early_items = ["Morph", "Missile", "Bombs", "SpeedBooster"]
-        early_item = self.multiworld.random.choice(early_items)
+        early_item = self.random.choice(early_items)
         self.multiworld.local_early_items[self.player][early_item] = 1
 
     def create_regions(self) -> None:
@@ -66,34 +77,33 @@ class CliffReduxWorld(World):
         cliff_game = make_cliff_game(self.multiworld.seed)
         self.cliff_game = cliff_game
 
+        # one region per logic area, so Archipelago's region cache checks each area once per sweep
+        regions: Dict[Optional[str], Region] = {None: menu}
+        for area_name, entrance in area_graph.areas.items():
+            region = Region(area_name, self.player, self.multiworld)
+            self.multiworld.regions.append(region)
+            regions[area_name] = region
+            parent = regions[entrance.area]
+            parent.connect(region, f"{parent.name} -> {area_name}", self.rules.rule(area_key(area_name)))
+
         for loc_name in _loc_name_to_id:
-            loc = CliffReduxLocation(self.player, loc_name, menu)
-            menu.locations.append(loc)
-
-            def access_rule_wrapped(local_loc_name: str,
-                                    local_cliff_game: CliffGame,
-                                    p: int,
-                                    collection_state: CollectionState) -> bool:
-                loadout = cs_to_loadout(local_cliff_game, collection_state, p)
-                return location_logic[local_loc_name](loadout)
-
-            access_rule = functools.partial(access_rule_wrapped,
-                                            loc_name, self.cliff_game, self.player)
-            loc.access_rule = access_rule
-
-            # completion condition
-            def completion_wrapped(local_cliff_game: CliffGame,
-                                   p: int,
-                                   collection_state: CollectionState) -> bool:
-                loadout = cs_to_loadout(local_cliff_game, collection_state, p)
-                return can_win in loadout
-
-            completion = functools.partial(completion_wrapped, cliff_game, self.player)
-            self.multiworld.completion_condition[self.player] = completion
+            placement = area_graph.locations[loc_name]
+            region = regions[placement.area]
+            loc = CliffReduxLocation(self.player, loc_name, region)
+            region.locations.append(loc)
+
+            # the rest of the rule after the area - locations that don't need anything else keep the default rule
+            access_rule = self.rules.rule(location_key(loc_name))
+            if access_rule:
+                loc.access_rule = access_rule
+
+        completion = self.rules.rule(completion_key)
+        assert completion, "can_win needs items"
+        self.multiworld.completion_condition[self.player] = completion
 
     def create_items(self) -> None:
         count_e = 0  # 12 Energy are progression , the rest are not
-        count_m = 0 # 4 Missiles are progression, the rest are not
+        count_m = 0  # 4 Missiles are progression, the rest are not
         count_s = 0  # 5 Supers are progression, the rest are not
         count_p = 0  # 5 PowerBombs are progression, the rest are not
         for name in names_for_item_pool():
@@ -116,17 +126,55 @@ class CliffReduxWorld(World):
                 count_p += 1
             self.multiworld.itempool.append(this_item)
 
+    def collect(self, state: CollectionState, item: Item) -> bool:
+        self.rules.invalidate(state)
+        return super().collect(state, item)
+
+    def remove(self, state: CollectionState, item: Item) -> bool:
+        self.rules.invalidate(state)
+        return super().remove(state, item)
+
     def get_filler_item_name(self) -> str:
         filler_items = ["Missile", "Super", "PowerBomb"]
-        filler_item = self.multiworld.random.choice(filler_items)
+        filler_item = self.random.choice(filler_items)
         return filler_item
 
+    @classmethod
+    def _start_output(cls, multiworld: MultiWorld, output_directory: str) -> Dict[int, "Future[None]"]:
+        """
+        the first call (from any slot or the stage) indexes the multiworld locations once
+        and starts writing every Cliffhanger Redux slot's patch in a thread pool
+        (most of the time is zip deflate, which releases the GIL)
+        """
+        with _output_futures_lock:
+            futures = _output_futures.get(multiworld)
+            if futures is None:
+                index = LocationIndex(multiworld.get_locations())
+                # not item link groups - the same slots that get generate_output
+                worlds = [world for world in multiworld.worlds.values()
+                          if isinstance(world, cls) and world.player in multiworld.player_ids]
+                executor = ThreadPoolExecutor(max_workers=min(len(worlds), os.cpu_count() or 1),
+                                              thread_name_prefix="cliffredux_output")
+                futures = {
+                    world.player: executor.submit(world._write_output, output_directory, index)
+                    for world in worlds
+                }
+                executor.shutdown(wait=False)
+                _output_futures[multiworld] = futures
+        return futures
+
+    @classmethod
+    def stage_generate_output(cls, multiworld: MultiWorld, output_directory: str) -> None:
+        for future in cls._start_output(multiworld, output_directory).values():
+            future.result()
+
     def generate_output(self, output_directory: str) -> None:
         assert self.cliff_game, "can't call generate_output without create_regions"
+        self._start_output(self.multiworld, output_directory)[self.player].result()
 
+    def _write_output(self, output_directory: str, index: LocationIndex) -> None:
         item_rom_data = ItemRomData(self.player, self.multiworld.player_name)
-        for loc in self.multiworld.get_locations():
-            item_rom_data.register(loc)
+        item_rom_data.register_index(index)
 
         # set rom name
         from Utils import __version__
@@ -139,18 +187,23 @@ class CliffReduxWorld(World):
         self.rom_name = rom_name
         self.rom_name_available_event.set()
 
-        gen_data = GenData(item_rom_data.get_jsonable_data(), self.cliff_game, self.player, self.rom_name)
+        gen_data = GenData(item_rom_data.get_packed_data(), self.player, self.rom_name)
 
         out_file_base = self.multiworld.get_out_file_name_base(self.player)
 
         patch_file_name = os.path.join(output_directory, f"{out_file_base}{CliffReduxDeltaPatch.patch_file_ending}")
         patch = CliffReduxDeltaPatch(patch_file_name,
-                                       player=self.player,
-                                       player_name=self.multiworld.player_name[self.player],
-                                       gen_data=make_gen_data(gen_data))
+                                     player=self.player,
+                                     player_name=self.multiworld.player_name[self.player],
+                                     gen_data=make_gen_data(gen_data),
+                                     seed_ips=make_seed_ips(gen_data))
 
         patch.write()
 
+        if instrumentation.enabled:
+            logging.info(f"Cliffhanger Redux instrumentation after output for player {self.player}:\n"
+                         f"{instrumentation.report()}")
+
     def modify_multidata(self, multidata: Dict[str, Any]) -> None:
         import base64
         # wait for self.rom_name to be available.
@@ -0,0 +1,170 @@
+"""
+patch many .apcr files at once, in parallel
+
+run from the Archipelago directory:
+    python -m worlds.cliffredux.bulk_patch seeds/ more.apcr --output-dir roms --workers 8
+
+The base patched rom (`get_base_patched_rom_bytes`) is made once, in this process,
+and put in shared memory. Each worker process attaches to it without copying it,
+and each output rom starts as a copy of it (`RomWriter.fromMappedCopy`),
+so only the seed's writes are done for each file.
+
+The rom cache isn't used, because each seed is only patched once.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional
+
+from .cliff_redux_randomizer.romWriter import RomWriter
+from .patch_utils import get_gen_data
+from .rom import CliffReduxDeltaPatch, get_base_patch_digest, get_base_patched_rom_bytes, get_base_patched_rom_sum, \
+    write_seed_data
+
+logger = logging.getLogger("Cliffhanger Redux bulk patch")
+
+
+@dataclass
+class PatchResult:
+    apcr_path: str
+    rom_path: str
+    seconds: float
+    """ in the worker, from opening the .apcr to the rom written """
+    md5: str = ""
+    crc32: int = 0
+    error: str = ""
+
+
+@dataclass
+class _BaseRom:
+    """ what the workers share - the same for every patch """
+    memory: SharedMemory
+    size: int
+    rom_sum: int
+    patch_digest: str
+
+    @property
+    def data(self) -> memoryview:
+        # shared memory can be bigger than what was asked for (rounded up to the page size)
+        return self.memory.buf[:self.size]
+
+
+_base: Optional[_BaseRom] = None
+""" in each worker """
+
+
+def _attach(memory_name: str, size: int, rom_sum: int, patch_digest: str) -> None:
+    """ worker pool initializer """
+    global _base
+    _base = _BaseRom(SharedMemory(memory_name), size, rom_sum, patch_digest)
+
+
+def patch_container(apcr_path: str, rom_path: str) -> PatchResult:
+    """ worker - one .apcr file to a rom file """
+    assert _base, "worker not attached to the base rom"
+    start = time.perf_counter()
+    try:
+        patch = CliffReduxDeltaPatch(apcr_path)
+        patch.read()
+        # closed and removed if it fails, so a partly written rom isn't left at `rom_path`
+        with RomWriter.fromMappedCopy(_base.data, rom_path) as rom_writer:
+            rom_writer.trackChecksum(_base.rom_sum)
+            seed_ips = patch.usable_seed_ips(_base.patch_digest)
+            if seed_ips:
+                rom_writer.applyIps(seed_ips)
+            else:
+                write_seed_data(rom_writer, get_gen_data(patch.gen_data))
+            rom_writer.finalizeRom()
+    except Exception as e:
+        return PatchResult(apcr_path, rom_path, time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+    assert rom_writer.md5 is not None and rom_writer.crc32 is not None
+    return PatchResult(apcr_path, rom_path, time.perf_counter() - start, rom_writer.md5, rom_writer.crc32)
+
+
+def find_containers(paths: List[str]) -> List[str]:
+    """ the .apcr files in these files and directories (not searching subdirectories) """
+    tr: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            tr.extend(sorted(
+                entry.path for entry in os.scandir(path)
+                if entry.is_file() and entry.name.endswith(CliffReduxDeltaPatch.patch_file_ending)
+            ))
+        else:
+            tr.append(path)
+    return tr
+
+
+def rom_path_for(apcr_path: str, output_dir: Optional[str]) -> str:
+    base_name = os.path.splitext(os.path.basename(apcr_path))[0] + CliffReduxDeltaPatch.result_file_ending
+    return os.path.join(output_dir if output_dir else os.path.dirname(apcr_path), base_name)
+
+
+def bulk_patch(apcr_paths: List[str],
+               output_dir: Optional[str] = None,
+               workers: Optional[int] = None) -> List[PatchResult]:
+    """ results in the order they finish - reported to the log as they finish """
+    workers = workers or os.cpu_count() or 1
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    base_patched_rom = get_base_patched_rom_bytes()
+    memory = SharedMemory(create=True, size=len(base_patched_rom))
+    try:
+        memory.buf[:len(base_patched_rom)] = base_patched_rom
+        base_args = (memory.name, len(base_patched_rom), get_base_patched_rom_sum(), get_base_patch_digest())
+        logger.info(f"base patched rom ready in {time.perf_counter() - start:.2f} s")
+
+        results: List[PatchResult] = []
+        patch_start = time.perf_counter()
+        with ProcessPoolExecutor(workers, initializer=_attach, initargs=base_args) as executor:
+            futures = [
+                executor.submit(patch_container, apcr_path, rom_path_for(apcr_path, output_dir))
+                for apcr_path in apcr_paths
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if result.error:
+                    logger.error(f"{result.apcr_path}: {result.error}")
+                else:
+                    logger.info(f"{result.rom_path} in {result.seconds * 1000:.1f} ms "
+                                f"md5 {result.md5} crc32 {result.crc32:08x}")
+        seconds = time.perf_counter() - patch_start
+    finally:
+        memory.close()
+        memory.unlink()
+
+    done = [result for result in results if not result.error]
+    if done:
+        latencies = sorted(result.seconds for result in done)
+        megabytes = len(base_patched_rom) * len(done) / (1024 * 1024)
+        logger.info(f"{len(done)} roms in {seconds:.2f} s with {workers} workers: "
+                    f"{len(done) / seconds:.1f} roms/s, {megabytes / seconds:.1f} MiB/s - "
+                    f"latency median {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+                    f"max {latencies[-1] * 1000:.1f} ms")
+    if len(done) < len(results):
+        logger.error(f"{len(results) - len(done)} failed")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="patch many Cliffhanger Redux .apcr files")
+    parser.add_argument("paths", nargs="+", help=".apcr files, or directories of them")
+    parser.add_argument("--output-dir", default=None, help="default: next to each .apcr file")
+    parser.add_argument("--workers", type=int, default=None, help="default: number of cpus")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    results = bulk_patch(find_containers(args.paths), args.output_dir, args.workers)
+    sys.exit(1 if any(result.error for result in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import asyncio
+import hashlib
 import logging
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
 from NetUtils import ClientStatus, color
 from .config import base_id
@@ -9,7 +10,7 @@ from .patch_utils import offset_from_symbol
 from ..AutoSNIClient import SNIClient
 
 if TYPE_CHECKING:
-    from SNIClient import SNIContext
+    from SNIClient import SNIClientCommandProcessor, SNIContext
 
 snes_logger = logging.getLogger("SNES")
 
@@ -38,9 +39,91 @@ SM_DEATH_LINK_ACTIVE_ADDR = ROM_START + offset_from_symbol("config_deathlink")
 SM_REMOTE_ITEM_FLAG_ADDR = ROM_START + offset_from_symbol("config_remote_items")  # 1 byte
 
 
+def _cmd_cr_hot_patch(self: "SNIClientCommandProcessor", apcr_path: str = "") -> bool:
+    """ write a Cliffhanger Redux seed (.apcr file) into the rom that's running, instead of making a rom file """
+    client_handler = getattr(self.ctx, "client_handler", None)
+    if not apcr_path:
+        self.output("usage: /cr_hot_patch <path to .apcr file>")
+        return False
+    if not isinstance(client_handler, CliffReduxSNIClient):
+        self.output("Cliffhanger Redux rom isn't running")
+        return False
+    if client_handler.hot_patch_task and not client_handler.hot_patch_task.done():
+        self.output("a hot patch is already running")
+        return False
+    self.output(f"hot patching {apcr_path}...")
+    client_handler.hot_patch_task = asyncio.create_task(client_handler.hot_patch(self.ctx, apcr_path))
+    return True
+
+
+def _make_hot_patch_writes(apcr_path: str, previous_ranges: List[Tuple[int, int]]) -> List[Tuple[int, bytes]]:
+    """ reads the .apcr file and (if it's not loaded yet) the base patched rom - not for the event loop """
+    from .rom import CliffReduxDeltaPatch, make_hot_patch
+
+    patch = CliffReduxDeltaPatch(apcr_path)
+    patch.read()
+    return make_hot_patch(patch.gen_data, patch.usable_seed_ips(), previous_ranges)
+
+
 class CliffReduxSNIClient(SNIClient):
     game = "Cliffhanger Redux"
 
+    hot_patched_ranges: List[Tuple[int, int]]
+    """ rom (begin, end) written by `hot_patch` since the rom was loaded """
+    hot_patch_task: "Optional[asyncio.Task[bool]]"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.hot_patched_ranges = []
+        self.hot_patch_task = None
+
+    async def hot_patch(self, ctx: "SNIContext", apcr_path: str) -> bool:
+        """
+        write only the seed's bytes (a few KB) into the device's rom, then read them back to check them
+
+        The device needs to be running the base patched rom, or a Cliffhanger Redux AP rom with the same base.
+        The game needs to be reset after this.
+        Errors are logged, not raised.
+        """
+        try:
+            return await self._hot_patch(ctx, apcr_path)
+        except Exception as e:
+            snes_logger.error(f"hot patch {apcr_path} failed: {type(e).__name__}: {e}")
+            return False
+
+    async def _hot_patch(self, ctx: "SNIContext", apcr_path: str) -> bool:
+        from SNIClient import snes_buffered_write, snes_flush_writes, snes_read
+
+        start = time.perf_counter()
+        # (building the base patched rom the first time takes a while - not on the event loop)
+        writes = await asyncio.get_running_loop().run_in_executor(
+            None, _make_hot_patch_writes, apcr_path, list(self.hot_patched_ranges)
+        )
+
+        expected = hashlib.md5()
+        for offset, data in writes:
+            snes_buffered_write(ctx, ROM_START + offset, data)
+            expected.update(data)
+        await snes_flush_writes(ctx)
+        self.hot_patched_ranges = [(offset, offset + len(data)) for offset, data in writes]
+
+        read_back = hashlib.md5()
+        for offset, data in writes:
+            device_data = await snes_read(ctx, ROM_START + offset, len(data))
+            if device_data is None:
+                snes_logger.error("hot patch: connection lost reading back the rom")
+                return False
+            read_back.update(device_data)
+        if read_back.digest() != expected.digest():
+            snes_logger.error(f"hot patch: rom read back doesn't match what was written "
+                              f"({read_back.hexdigest()} != {expected.hexdigest()}) "
+                              f"- the device might not allow writing to rom")
+            return False
+
+        snes_logger.info(f"hot patched {apcr_path}: {sum(len(data) for _, data in writes)} bytes "
+                         f"in {len(writes)} ranges in {time.perf_counter() - start:.2f} s - reset the game")
+        return True
+
     async def deathlink_kill_player(self, ctx: "SNIContext") -> None:
         from SNIClient import DeathState, snes_buffered_write, snes_flush_writes, snes_read
         # set current health to 1 (to prevent saving with 0 energy)
@@ -85,6 +168,10 @@ class CliffReduxSNIClient(SNIClient):
 
         ctx.rom = rom_name
 
+        commands = ctx.command_processor.commands
+        if "cr_hot_patch" not in commands:
+            commands["cr_hot_patch"] = _cmd_cr_hot_patch
+
         death_link = await snes_read(ctx, SM_DEATH_LINK_ACTIVE_ADDR, 1)
 
         if death_link:
@@ -0,0 +1,140 @@
+"""
+generate many stand-alone seeds in a process pool
+
+run from the directory containing `cliff_redux_randomizer`:
+    python -m cliff_redux_randomizer.batch --count 500 --ips --output seeds.jsonl
+
+Each line of the output is one seed, written as soon as it finishes.
+Seeds that fail to fill or aren't completable are retried with a new seed
+derived from the requested seed. Each fill has its own `random.Random`
+seeded from its seed, so the same command gives the same output.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import IO, Any, Iterable, Optional, Sequence
+
+from .game import Game
+from .generate import generate
+from .romWriter import RomWriter
+
+
+def retry_seed(requested_seed: int, attempt: int) -> int:
+    """ the seed to use for this attempt of a requested seed (attempt 0 is the requested seed) """
+    if attempt == 0:
+        return requested_seed
+    return random.Random(f"{requested_seed}:{attempt}").getrandbits(32)
+
+
+def make_ips(game: Game) -> bytes:
+    """ IPS patch placing the items of this game (on a Cliffhanger Redux rom) """
+    rom_writer = RomWriter.fromBlankIps()
+    for loc in game.all_locations.values():
+        item = loc["item"]
+        assert item, f"no item in {loc['roomname']}"
+        if loc["hiddenness"] == "hidden":
+            plmid = item[3]
+        elif loc["hiddenness"] == "chozo":
+            plmid = item[2]
+        else:
+            plmid = item[1]
+        rom_writer.writeItem(loc["locationid"], plmid, item[4])
+        if loc["altlocationids"][0] != 0:
+            for address in loc["altlocationids"]:
+                rom_writer.writeItem(address, plmid, item[4])
+    rom_writer.finalizeRom()
+    return bytes(rom_writer.getFinalIps())
+
+
+def generate_seed(requested_seed: int, max_attempts: int, include_ips: bool) -> dict[str, Any]:
+    """ worker - returns one output record """
+    start = time.perf_counter()
+    record: dict[str, Any] = {"requested_seed": requested_seed}
+    for attempt in range(max_attempts):
+        seed = retry_seed(requested_seed, attempt)
+        try:
+            game, completable = generate(seed)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            continue
+        if completable:
+            record.pop("error", None)
+            record["seed"] = seed
+            record["attempts"] = attempt + 1
+            if include_ips:
+                record["ips"] = base64.b64encode(make_ips(game)).decode()
+            record["game"] = game.to_jsonable()
+            break
+    else:
+        record["attempts"] = max_attempts
+        record.setdefault("error", "no completable seed")
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def run(seeds: Iterable[int],
+        output: IO[str],
+        workers: Optional[int] = None,
+        max_attempts: int = 10,
+        include_ips: bool = False) -> tuple[int, int]:
+    """ returns (succeeded, failed) """
+    succeeded = 0
+    failed = 0
+    seed_iter = iter(seeds)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        pending: set[Future[dict[str, Any]]] = set()
+
+        def submit_more() -> None:
+            # keep a bounded number of seeds in flight, so results don't pile up in memory
+            while len(pending) < workers * 2:
+                seed = next(seed_iter, None)
+                if seed is None:
+                    return
+                pending.add(executor.submit(generate_seed, seed, max_attempts, include_ips))
+
+        submit_more()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                if "error" in record:
+                    failed += 1
+                else:
+                    succeeded += 1
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+            submit_more()
+    return succeeded, failed
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="generate many seeds in parallel")
+    parser.add_argument("--count", type=int, default=100, help="how many seeds to generate")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="default: number of cpus")
+    parser.add_argument("--max-attempts", type=int, default=10,
+                        help="how many new seeds to try before giving up on a requested seed")
+    parser.add_argument("--ips", action="store_true", help="include a base64 IPS patch for each seed")
+    parser.add_argument("--output", default="-", help="json lines file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    seeds = range(args.first_seed, args.first_seed + args.count)
+    start = time.perf_counter()
+    if args.output == "-":
+        succeeded, failed = run(seeds, sys.stdout, args.workers, args.max_attempts, args.ips)
+    else:
+        with open(args.output, "w") as output:
+            succeeded, failed = run(seeds, output, args.workers, args.max_attempts, args.ips)
+    seconds = time.perf_counter() - start
+    print(f"{succeeded} seeds, {failed} failed, {seconds:.2f}s ({succeeded / seconds:.1f} seeds/s)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
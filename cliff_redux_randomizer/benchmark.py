@@ -0,0 +1,195 @@
+"""
+micro-benchmarks for the fill and solver
+
+run from the directory containing `cliff_redux_randomizer`:
+    python -m cliff_redux_randomizer.benchmark --seeds 200 --profile-slowest 3
+"""
+import argparse
+import cProfile
+import io
+import json
+import math
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, ClassVar, Iterable, Optional, Sequence, Type
+
+from .defaultLogic import Default
+from .fillAssumed import FillAssumed
+from .game import Game
+from .generate import generate
+from .loadout import Loadout
+from .location import Location
+from .logicInterface import LocationLogicType, LogicInterface
+
+
+@dataclass
+class SeedResult:
+    seed: int
+    seconds: float
+    solves: int
+    """ how many times `solver.solve` ran (fill and final verification) """
+    spheres: int
+    """ spheres in the final playthrough """
+    rule_evaluations: int
+    """ calls to `location_logic` rules """
+    completable: bool
+    serialize_seconds: float
+    """ `Game.dump` of the generated game """
+    serialize_peak_bytes: int
+    """ peak memory allocated during `Game.dump` """
+
+
+class _Counters:
+    solves = 0
+    rule_evaluations = 0
+
+
+def _counting_logic(logic: Type[LogicInterface], counters: _Counters) -> Type[LogicInterface]:
+    """ the same logic, with every location rule call counted """
+
+    def counted(rule: Callable[[Loadout], bool]) -> Callable[[Loadout], bool]:
+        def wrapped(loadout: Loadout) -> bool:
+            counters.rule_evaluations += 1
+            return rule(loadout)
+        return wrapped
+
+    class CountingLogic(logic):  # type: ignore
+        location_logic: ClassVar[LocationLogicType] = {
+            loc_name: counted(rule) for loc_name, rule in logic.location_logic.items()
+        }
+
+    return CountingLogic
+
+
+class _NullWriter(io.TextIOBase):
+    def write(self, s: str) -> int:
+        return len(s)
+
+
+def _measure_serialization(game: Game) -> tuple[float, int]:
+    """ (seconds, peak bytes) """
+    start = time.perf_counter()
+    game.dump(_NullWriter())
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    game.dump(_NullWriter())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+class _CountingFill(FillAssumed):
+    def __init__(self, counters: _Counters, rng: random.Random) -> None:
+        super().__init__(rng)
+        self.counters = counters
+
+    def _get_accessible_locations(self, loadout: Loadout) -> list[Location]:
+        self.counters.solves += 1
+        return super()._get_accessible_locations(loadout)
+
+
+def run_seed(seed: int, logic: Type[LogicInterface] = Default) -> SeedResult:
+    counters = _Counters()
+    counting_logic = _counting_logic(logic, counters)
+
+    fill = _CountingFill(counters, random.Random(seed))
+    start = time.perf_counter()
+    game, completable = generate(seed, fill, counting_logic)
+    seconds = time.perf_counter() - start
+
+    spheres = game.item_placement_spoiler.split("\n").count("sphere:")
+    serialize_seconds, serialize_peak = _measure_serialization(game)
+    # `generate` runs one more solve to verify the seed, if the fill placed every item
+    verification_solves = 0 if fill.count_items_remaining() else 1
+    return SeedResult(seed, seconds, counters.solves + verification_solves, spheres, counters.rule_evaluations,
+                      completable, serialize_seconds, serialize_peak)
+
+
+def run(seeds: Iterable[int], logic: Type[LogicInterface] = Default) -> list[SeedResult]:
+    return [run_seed(seed, logic) for seed in seeds]
+
+
+def percentile(sorted_values: Sequence[float], p: float) -> float:
+    """ nearest-rank percentile of already sorted values """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(results: Sequence[SeedResult]) -> dict[str, dict[str, float]]:
+    """ {metric: {statistic: value}} """
+    summary: dict[str, dict[str, float]] = {}
+    for metric in ("seconds", "solves", "spheres", "rule_evaluations", "serialize_seconds", "serialize_peak_bytes"):
+        values = sorted(float(getattr(result, metric)) for result in results)
+        summary[metric] = {
+            "min": values[0],
+            "mean": statistics.fmean(values),
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "p99": percentile(values, 99),
+            "max": values[-1],
+        }
+    summary["completable"] = {
+        "count": sum(result.completable for result in results),
+        "rate": sum(result.completable for result in results) / len(results),
+    }
+    return summary
+
+
+def profile_seeds(seeds: Iterable[int], directory: str, logic: Type[LogicInterface] = Default) -> list[str]:
+    """ re-run these seeds under cProfile, returns the paths of the .prof dumps """
+    os.makedirs(directory, exist_ok=True)
+    paths: list[str] = []
+    for seed in seeds:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        run_seed(seed, logic)
+        profiler.disable()
+        path = os.path.join(directory, f"seed_{seed}.prof")
+        profiler.dump_stats(path)
+        paths.append(path)
+    return paths
+
+
+def format_summary(summary: dict[str, dict[str, float]]) -> str:
+    lines: list[str] = []
+    for metric, stats in summary.items():
+        lines.append(f"{metric:>20}: " + "  ".join(f"{name} {value:.4g}" for name, value in stats.items()))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="benchmark FillAssumed and solver.solve")
+    parser.add_argument("--seeds", type=int, default=100, help="how many seeds to generate")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--profile-slowest", type=int, default=0,
+                        help="re-run this many of the slowest seeds under cProfile")
+    parser.add_argument("--profile-dir", default="benchmark_profiles")
+    parser.add_argument("--json", help="write per-seed results and summary to this file")
+    args = parser.parse_args(argv)
+
+    results = run(range(args.first_seed, args.first_seed + args.seeds))
+    summary = summarize(results)
+    print(format_summary(summary))
+
+    if args.profile_slowest:
+        slowest = sorted(results, key=lambda result: result.seconds, reverse=True)[:args.profile_slowest]
+        for path in profile_seeds((result.seed for result in slowest), args.profile_dir):
+            print(f"profile: {path}")
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({
+                "results": [asdict(result) for result in results],
+                "summary": summary,
+            }, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
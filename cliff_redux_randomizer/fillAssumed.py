@@ -20,8 +20,11 @@ class FillAssumed(FillAlgorithm):
     prog_items: list[Item]
     extra_items: list[Item]
     itemLists: list[list[Item]]
+    rng: random.Random
 
-    def __init__(self) -> None:
+    def __init__(self, rng: Optional[random.Random] = None) -> None:
+        """ `rng` - seed it (from `Game.seed`) for reproducible placement """
+        self.rng = rng if rng is not None else random.Random()
         self.prog_items = [
             Items.Missile,
             Items.Morph,
@@ -62,9 +65,8 @@ class FillAssumed(FillAlgorithm):
     def _get_empty_locations(self, all_locations: dict[str, Location]) -> list[Location]:
         return [loc for loc in all_locations.values() if loc["item"] is None]
 
-    @staticmethod
-    def _choose_location(locs: list[Location]) -> Location:
-        return random.choice(locs)
+    def _choose_location(self, locs: list[Location]) -> Location:
+        return self.rng.choice(locs)
 
     def choose_placement(self, availableLocations: list[Location], loadout: Loadout) -> Optional[tuple[Location, Item]]:
         from_items = (
@@ -75,7 +77,7 @@ class FillAssumed(FillAlgorithm):
 
         assert len(from_items), "tried to place item when placement algorithm has 0 items left in item pool"
 
-        item_to_place = random.choice(from_items)
+        item_to_place = self.rng.choice(from_items)
 
         from_items.remove(item_to_place)
 
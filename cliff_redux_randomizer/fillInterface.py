@@ -9,7 +9,11 @@ from .location import Location
 class FillAlgorithm(abc.ABC):
     @abc.abstractmethod
     def __init__(self) -> None:
-        """ setup, build item pool, etc. """
+        """
+        setup, build item pool, etc.
+
+        any randomness should come from a `random.Random` passed in here, not the global `random` module
+        """
 
     @abc.abstractmethod
     def choose_placement(self, availableLocations: list[Location],
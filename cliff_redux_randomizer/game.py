@@ -1,12 +1,30 @@
-from copy import deepcopy
-from dataclasses import dataclass, asdict
-from typing import Type, Any, cast, Optional
+import json
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Iterable, Type, cast, Optional
 
 from .defaultLogic import Default
 from .item import all_items
 from .location import Location
 from .logicInterface import LogicInterface
 
+if TYPE_CHECKING:
+    from _typeshed import SupportsWrite
+
+
+def _location_to_jsonable(loc: Location) -> dict[str, Any]:
+    dct = cast(dict[str, Any], dict(loc))
+    dct["altlocationids"] = list(loc["altlocationids"])
+    item = loc["item"]
+    dct["item"] = item[0] if item else None
+    return dct
+
+
+def _location_from_jsonable(dct: dict[str, Any]) -> Location:
+    item_name = cast(Optional[str], dct["item"])
+    if item_name:
+        dct["item"] = all_items[item_name]
+    return cast(Location, dct)
+
 
 @dataclass
 class Game:
@@ -17,31 +35,50 @@ class Game:
     item_placement_spoiler: str = ""
 
     def to_jsonable(self) -> dict[str, Any]:
-        self.logic = None
-        dct = asdict(self)
-
-        locations_copy = deepcopy(self.all_locations)
-        dct["all_locations"] = locations_copy
-        for loc in locations_copy.values():
-            assert isinstance(loc, dict)
-            item = loc["item"]
-            if item:
-                item_name = item[0]
-                assert isinstance(item_name, str)
-                non_loc = cast(dict[str, Any], loc)
-                non_loc["item"] = item_name
-
-        return dct
+        """ doesn't modify this game or share any mutable data with it """
+        return {
+            "logic": None,
+            "all_locations": {
+                loc_name: _location_to_jsonable(loc)
+                for loc_name, loc in self.all_locations.items()
+            },
+            "seed": self.seed,
+            "item_placement_spoiler": self.item_placement_spoiler,
+        }
 
     @staticmethod
     def from_jsonable(dct: dict[str, Any]) -> "Game":
         game = Game(**dct)
 
         for loc in game.all_locations.values():
-            item = loc["item"]
-            item_name = cast(Optional[str], item)
-            if item_name:
-                loc["item"] = all_items[item_name]
+            _location_from_jsonable(cast(dict[str, Any], loc))
 
         game.logic = Default
         return game
+
+    def dump(self, file: "SupportsWrite[str]") -> None:
+        """
+        write this game to a text stream as json lines, one location at a time
+
+        first line is the header: seed, spoiler, and how many locations follow
+        """
+        file.write(json.dumps({
+            "seed": self.seed,
+            "item_placement_spoiler": self.item_placement_spoiler,
+            "location_count": len(self.all_locations),
+        }))
+        file.write("\n")
+        for loc in self.all_locations.values():
+            file.write(json.dumps(_location_to_jsonable(loc)))
+            file.write("\n")
+
+    @staticmethod
+    def load(lines: Iterable[str]) -> "Game":
+        """ the reverse of `dump` - `lines` can be the text stream """
+        line_iter = iter(lines)
+        header = json.loads(next(line_iter))
+        all_locations: dict[str, Location] = {}
+        for _ in range(header["location_count"]):
+            loc = _location_from_jsonable(json.loads(next(line_iter)))
+            all_locations[loc["roomname"]] = loc
+        return Game(Default, all_locations, header["seed"], header["item_placement_spoiler"])
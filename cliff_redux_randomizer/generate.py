@@ -0,0 +1,51 @@
+import random
+from typing import Optional, Type
+
+from .defaultLogic import Default
+from .fillAssumed import FillAssumed
+from .fillInterface import FillAlgorithm
+from .game import Game
+from .loadout import Loadout
+from .location import pullCSV
+from .logicInterface import LogicInterface
+from .solver import solve
+
+
+def new_game(seed: int, logic: Type[LogicInterface] = Default) -> Game:
+    """ a game with all locations empty """
+    return Game(logic, pullCSV(), seed)
+
+
+def fill_game(game: Game, fill: Optional[FillAlgorithm] = None) -> bool:
+    """
+    place every item from the fill algorithm's pool into `game`
+
+    returns False if the fill algorithm couldn't find a place for an item
+
+    default fill algorithm is `FillAssumed` seeded from `game.seed`
+    """
+    if fill is None:
+        fill = FillAssumed(random.Random(game.seed))
+    for loc in game.all_locations.values():
+        loc["item"] = None
+
+    loadout = Loadout(game)
+    while fill.count_items_remaining():
+        placement = fill.choose_placement([], loadout)
+        if placement is None:
+            return False
+        location, item = placement
+        location["item"] = item
+    return True
+
+
+def generate(seed: int,
+             fill: Optional[FillAlgorithm] = None,
+             logic: Type[LogicInterface] = Default) -> tuple[Game, bool]:
+    """ one fill attempt - returns (game, completable) """
+    game = new_game(seed, logic)
+    if not fill_game(game, fill):
+        return game, False
+    completable, spoiler, _ = solve(game)
+    game.item_placement_spoiler = "\n".join(spoiler)
+    return game, completable
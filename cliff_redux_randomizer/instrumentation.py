@@ -0,0 +1,172 @@
+"""
+opt-in call counts and timings for hot paths
+
+Turn it on with `enable()`, or by setting the environment variable
+`CLIFF_REDUX_INSTRUMENT` before import:
+    CLIFF_REDUX_INSTRUMENT=1              report is printed to stderr at exit
+    CLIFF_REDUX_INSTRUMENT=report.json    report is written to this file at exit
+
+When it's off, location rules and logic shortcuts are not wrapped at all,
+and the other hooks are a single check of `enabled`.
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from types import ModuleType
+from typing import Any, Callable, Optional, TypeVar
+
+from .logicInterface import LogicInterface
+from .logic_shortcut import LogicShortcut
+
+enabled = False
+
+_calls: defaultdict[tuple[str, str], int] = defaultdict(int)
+_seconds: defaultdict[tuple[str, str], float] = defaultdict(float)
+
+_wrapped_rules: list[tuple[dict[str, Any], str, Any]] = []
+""" (location_logic dict, location name, original rule) """
+_wrapped_shortcuts: list[LogicShortcut] = []
+
+_F = TypeVar("_F", bound=Callable[..., Any])
+
+
+def count(category: str, key: str = "", n: int = 1) -> None:
+    _calls[category, key] += n
+
+
+def add_time(category: str, key: str, seconds: float) -> None:
+    _seconds[category, key] += seconds
+
+
+def hook(category: str, key: str = "") -> Callable[[_F], _F]:
+    """ decorator - count and time calls to this function while instrumentation is enabled """
+    def decorator(fn: _F) -> _F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _seconds[category, key] += time.perf_counter() - start
+                _calls[category, key] += 1
+        return wrapper  # type: ignore
+    return decorator
+
+
+def _timed(category: str, key: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+    def wrapper(*args: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            _seconds[category, key] += time.perf_counter() - start
+            _calls[category, key] += 1
+    wrapper.__wrapped__ = fn  # type: ignore
+    return wrapper
+
+
+def _shortcut_names(module: ModuleType) -> dict[str, LogicShortcut]:
+    return {
+        name: value
+        for name, value in vars(module).items()
+        if isinstance(value, LogicShortcut)
+    }
+
+
+def enable(logic: Optional[type[LogicInterface]] = None,
+           shortcut_modules: Optional[list[ModuleType]] = None) -> None:
+    """
+    start counting
+
+    wraps the location rules of `logic` (default: `Default`)
+    and the `LogicShortcut`s defined in `shortcut_modules` (default: `defaultLogic`)
+    """
+    global enabled
+    if enabled:
+        return
+    from . import defaultLogic
+    if logic is None:
+        logic = defaultLogic.Default
+    if shortcut_modules is None:
+        shortcut_modules = [defaultLogic]
+
+    # wrap in place, so everything that imported `location_logic` sees it
+    location_logic = logic.location_logic
+    for loc_name, rule in location_logic.items():
+        _wrapped_rules.append((location_logic, loc_name, rule))
+        location_logic[loc_name] = _timed("location_logic", loc_name, rule)
+
+    for module in shortcut_modules:
+        for name, shortcut in _shortcut_names(module).items():
+            if shortcut in _wrapped_shortcuts:
+                continue
+            _wrapped_shortcuts.append(shortcut)
+            shortcut.access = _timed("LogicShortcut.access", name, shortcut.access)
+
+    enabled = True
+
+
+def disable() -> None:
+    """ stop counting and unwrap everything (collected numbers are kept until `reset`) """
+    global enabled
+    for location_logic, loc_name, rule in _wrapped_rules:
+        location_logic[loc_name] = rule
+    _wrapped_rules.clear()
+    for shortcut in _wrapped_shortcuts:
+        shortcut.access = shortcut.access.__wrapped__  # type: ignore
+    _wrapped_shortcuts.clear()
+    enabled = False
+
+
+def reset() -> None:
+    _calls.clear()
+    _seconds.clear()
+
+
+def snapshot() -> dict[str, dict[str, dict[str, float]]]:
+    """ {category: {key: {"calls": n, "seconds": s}}} """
+    tr: dict[str, dict[str, dict[str, float]]] = defaultdict(dict)
+    for category, key in sorted(set(_calls) | set(_seconds)):
+        tr[category][key] = {
+            "calls": _calls.get((category, key), 0),
+            "seconds": _seconds.get((category, key), 0.0),
+        }
+    return dict(tr)
+
+
+def report(top: int = 20) -> str:
+    """ human readable - for each category, the `top` keys with the most time (or calls) """
+    lines: list[str] = []
+    for category, keys in snapshot().items():
+        total_calls = sum(stats["calls"] for stats in keys.values())
+        total_seconds = sum(stats["seconds"] for stats in keys.values())
+        lines.append(f"{category}: {total_calls:.0f} calls {total_seconds:.4f}s")
+        ranked = sorted(keys.items(), key=lambda kv: (kv[1]["seconds"], kv[1]["calls"]), reverse=True)
+        for key, stats in ranked[:top]:
+            if key:
+                lines.append(f"    {stats['calls']:>10.0f} {stats['seconds']:>10.4f}s  {key}")
+    return "\n".join(lines)
+
+
+def dump(path: str) -> None:
+    with open(path, "w") as file:
+        json.dump(snapshot(), file, indent=2)
+
+
+def _dump_at_exit(destination: str) -> None:
+    if destination == "1":
+        print(report(), file=sys.stderr)
+    else:
+        dump(destination)
+
+
+_env_setting = os.environ.get("CLIFF_REDUX_INSTRUMENT", "")
+if _env_setting and _env_setting != "0":
+    enable()
+    atexit.register(_dump_at_exit, _env_setting)
@@ -1,35 +1,56 @@
 # reference: https://zerosoft.zophar.net/ips.php http://justsolve.archiveteam.org/wiki/IPS_(binary_patch_format)
 
 
-from typing import Union
+import mmap
+from typing import Iterator, Tuple, Union
 
+from . import instrumentation
 
-def patch(original_bytes: Union[bytes, bytearray], patch_bytes: bytes) -> bytearray:
+
+def patch(original_bytes: Union[bytes, bytearray, mmap.mmap], patch_bytes: bytes) -> bytearray:
     """ `patch_bytes` is the data in the IPS file """
+    tr = bytearray(original_bytes)
+    patch_in_place(tr, patch_bytes)
+    return tr
+
+
+def records(patch_bytes: bytes) -> Iterator[Tuple[int, Union[bytes, memoryview]]]:
+    """ (offset, data) of each record in the IPS file (RLE records expanded) """
     if not (patch_bytes[:5] == b"PATCH" and patch_bytes[-3:] == b"EOF"):
         raise ValueError(f"invalid IPS patch: {patch_bytes[:5]!r}, {patch_bytes[-3:]!r}")
-    tr = bytearray(original_bytes)
+    view = memoryview(patch_bytes)
     cursor = 5
     data_limit = len(patch_bytes) - 3  # EOF
     record_begin_limit = data_limit - 5  # offset + size
+    record_count = 0
     while cursor <= record_begin_limit:
-        offset = int.from_bytes(patch_bytes[cursor:cursor + 3], "big")
-        size = int.from_bytes(patch_bytes[cursor + 3:cursor + 5], "big")
+        offset = int.from_bytes(view[cursor:cursor + 3], "big")
+        size = int.from_bytes(view[cursor + 3:cursor + 5], "big")
         cursor += 5
-        if offset > len(tr):
-            print("WARNING: IPS offset is beyond end of data")
-            # I don't know whether this should be considered invalid,
-            # or whether it should be 0xff or 0 or whatever...
-            tr.extend(0 for _ in range(offset - len(tr)))
         if size == 0:
             # RLE encoding
-            rle_size = int.from_bytes(patch_bytes[cursor:cursor + 2], "big")
-            rle_value = patch_bytes[cursor + 2]
-            tr[offset:offset + rle_size] = bytes(rle_value for _ in range(rle_size))
+            rle_size = int.from_bytes(view[cursor:cursor + 2], "big")
+            rle_value = view[cursor + 2]
+            yield offset, bytes((rle_value,)) * rle_size
             cursor += 3
         else:
             if cursor + size > data_limit:
                 raise ValueError(f"not enough data in IPS file for record at {cursor - 5}: {offset} {size}")
-            tr[offset:offset + size] = patch_bytes[cursor:cursor + size]
+            yield offset, view[cursor:cursor + size]
             cursor += size
-    return tr
+        record_count += 1
+    if instrumentation.enabled:
+        instrumentation.count("ips.patch", "records", record_count)
+
+
+def patch_in_place(tr: Union[bytearray, mmap.mmap], patch_bytes: bytes) -> None:
+    """ like `patch`, but changes `tr` (which can only grow if it's a `bytearray`) """
+    for offset, data in records(patch_bytes):
+        if offset > len(tr):
+            if not isinstance(tr, bytearray):
+                raise ValueError(f"IPS offset {offset} is beyond end of data {len(tr)}")
+            print("WARNING: IPS offset is beyond end of data")
+            # I don't know whether this should be considered invalid,
+            # or whether it should be 0xff or 0 or whatever...
+            tr.extend(0 for _ in range(offset - len(tr)))
+        tr[offset:offset + len(data)] = data
@@ -1,3 +1,4 @@
+from array import array
 from collections import Counter
 from typing import TYPE_CHECKING, Any, Iterable, Iterator, Optional, Union
 
@@ -15,10 +16,16 @@ class ItemCounter(Counter[Item]):
 
 class Loadout:
     contents: ItemCounter
+    _shortcut_memo: Optional[dict[LogicShortcut, bool]]
+    """ only while evaluating many rules at once, when the contents can't change """
+    _accessible: Optional[tuple[frozenset[tuple[Item, int]], "array[int]"]]
+    """ (contents when evaluated, result of `accessible_locations`) """
 
     def __init__(self, game: "Game", items: Optional[Iterable[Item]] = None) -> None:
         self.game = game
         self.contents = ItemCounter(items)
+        self._shortcut_memo = None
+        self._accessible = None
 
     def __eq__(self, __o: object) -> bool:
         if not isinstance(__o, Loadout):
@@ -30,7 +37,14 @@ class Loadout:
 
     def __contains__(self, x: Union[Item, LogicShortcut]) -> bool:
         if isinstance(x, LogicShortcut):
-            return x.access(self)
+            memo = self._shortcut_memo
+            if memo is None:
+                return x.access(self)
+            tr = memo.get(x)
+            if tr is None:
+                tr = x.access(self)
+                memo[x] = tr
+            return tr
         return self.contents[x] > 0
 
     def __iter__(self) -> Iterator[Item]:
@@ -58,3 +72,27 @@ class Loadout:
 
     def copy(self) -> "Loadout":
         return Loadout(self.game, self.contents)
+
+    def accessible_locations(self) -> "array[int]":
+        """
+        `array('B')` indexed by location `index` - 1 if that location's logic is satisfied
+
+        Each shortcut is evaluated at most once for all the locations,
+        and the result is reused until the contents of this loadout change.
+        Don't modify the returned array.
+        """
+        key = frozenset(self.contents.items())
+        if self._accessible and self._accessible[0] == key:
+            return self._accessible[1]
+
+        all_locations = self.game.all_locations
+        location_logic = self.game.logic.location_logic
+        tr = array('B', bytes(max(loc["index"] for loc in all_locations.values()) + 1))
+        self._shortcut_memo = {}
+        try:
+            for loc in all_locations.values():
+                tr[loc["index"]] = location_logic[loc["roomname"]](self)
+        finally:
+            self._shortcut_memo = None
+        self._accessible = (key, tr)
+        return tr
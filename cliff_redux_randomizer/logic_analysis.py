@@ -0,0 +1,325 @@
+"""
+static analysis of a logic module (like `defaultLogic`)
+
+Reads the source of the `LogicShortcut`s and the `location_logic` rules
+and turns each one into disjunctive normal form: a set of alternative
+clauses, each clause being the minimum item counts needed.
+
+This understands what the logic files are written with:
+`and`, `or`, `X in loadout`, `loadout.count(X) >= n` (optionally `* k`),
+`loadout.has_all(...)` and `loadout.has_any(...)`.
+Anything else raises `ValueError`, so a rule can't be silently misread.
+"""
+import ast
+import inspect
+import math
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Iterable, Mapping, Optional, Sequence
+
+from .item import all_items
+from .logic_shortcut import LogicShortcut
+
+Requirement = tuple[str, int]
+""" (item name, minimum count) """
+Clause = frozenset[Requirement]
+""" all of these requirements """
+DNF = frozenset[Clause]
+""" any of these clauses """
+
+ALWAYS: DNF = frozenset({frozenset()})
+NEVER: DNF = frozenset()
+
+
+def _normalize_clause(requirements: Iterable[Requirement]) -> Clause:
+    """ only the highest count of each item """
+    counts: dict[str, int] = {}
+    for item_name, n in requirements:
+        if n > counts.get(item_name, 0):
+            counts[item_name] = n
+    return frozenset(counts.items())
+
+
+def clause_implies(a: Clause, b: Clause) -> bool:
+    """ anything that satisfies `a` also satisfies `b` """
+    a_counts = dict(a)
+    return all(a_counts.get(item_name, 0) >= n for item_name, n in b)
+
+
+def _minimize(clauses: Iterable[Clause]) -> DNF:
+    """ remove clauses that are stronger than some other clause """
+    unique = sorted(set(clauses), key=len)
+    kept: list[Clause] = []
+    for clause in unique:
+        if not any(clause_implies(clause, other) for other in kept):
+            # same length doesn't mean it can't be weaker (a lower count of an item)
+            kept = [other for other in kept if not clause_implies(other, clause)]
+            kept.append(clause)
+    return frozenset(kept)
+
+
+def dnf_or(*dnfs: DNF) -> DNF:
+    return _minimize(clause for dnf in dnfs for clause in dnf)
+
+
+def dnf_and(*dnfs: DNF) -> DNF:
+    tr = ALWAYS
+    for dnf in dnfs:
+        tr = _minimize(
+            _normalize_clause(a | b)
+            for a in tr
+            for b in dnf
+        )
+    return tr
+
+
+def satisfies(dnf: DNF, counts: Mapping[str, int]) -> bool:
+    """ whether these item counts {item_name: count} satisfy `dnf` """
+    return any(
+        all(counts.get(item_name, 0) >= n for item_name, n in clause)
+        for clause in dnf
+    )
+
+
+def items_in(dnf: DNF) -> frozenset[str]:
+    """ every item that appears in this dnf """
+    return frozenset(item_name for clause in dnf for item_name, _ in clause)
+
+
+@dataclass(frozen=True)
+class AreaRequirement:
+    area: Optional[str]
+    """ `None` for the starting area """
+    requirement: DNF
+    """ what's needed in addition to being able to reach `area` """
+
+
+@dataclass(frozen=True)
+class AreaGraph:
+    """ a tree of areas, with each location in the deepest area its rule requires """
+    areas: dict[str, AreaRequirement]
+    """ {area: (parent area, entrance requirement)} - parents come before children """
+    locations: dict[str, AreaRequirement]
+    """ {location: (area, residual requirement)} """
+
+    def to_tables(self) -> dict[str, dict[str, tuple[Optional[str], DNF]]]:
+        """ only builtin types (for `marshal`) - `from_tables` is the reverse """
+        return {
+            "areas": {name: (entrance.area, entrance.requirement) for name, entrance in self.areas.items()},
+            "locations": {name: (placement.area, placement.requirement) for name, placement in self.locations.items()},
+        }
+
+    @staticmethod
+    def from_tables(tables: dict[str, dict[str, tuple[Optional[str], DNF]]]) -> "AreaGraph":
+        return AreaGraph(
+            {name: AreaRequirement(area, requirement) for name, (area, requirement) in tables["areas"].items()},
+            {name: AreaRequirement(area, requirement) for name, (area, requirement) in tables["locations"].items()},
+        )
+
+
+class LogicAnalysis:
+    """ DNF of every shortcut and location rule in a logic module """
+
+    shortcut_expressions: dict[str, ast.expr]
+    location_expressions: dict[str, ast.expr]
+    location_dnf: dict[str, DNF]
+
+    def __init__(self, module: ModuleType, location_logic_name: str = "location_logic") -> None:
+        self._items = {
+            name: value[0]
+            for name, value in vars(module).items()
+            if isinstance(value, tuple) and value in all_items.values()
+        }
+        shortcut_names = {
+            name for name, value in vars(module).items()
+            if isinstance(value, LogicShortcut)
+        }
+        self.shortcut_expressions = {}
+        self.location_expressions = {}
+
+        tree = ast.parse(inspect.getsource(module))
+        for statement in tree.body:
+            if isinstance(statement, ast.Assign):
+                value = statement.value
+                targets = [target.id for target in statement.targets if isinstance(target, ast.Name)]
+            elif isinstance(statement, ast.AnnAssign) and isinstance(statement.target, ast.Name) and statement.value:
+                value = statement.value
+                targets = [statement.target.id]
+            else:
+                continue
+            for target in targets:
+                if target in shortcut_names:
+                    assert isinstance(value, ast.Call) and len(value.args) == 1
+                    self.shortcut_expressions[target] = self._lambda_body(value.args[0])
+                elif target == location_logic_name:
+                    assert isinstance(value, ast.Dict)
+                    for key, rule in zip(value.keys, value.values):
+                        assert isinstance(key, ast.Constant) and isinstance(key.value, str)
+                        self.location_expressions[key.value] = self._lambda_body(rule)
+
+        self._shortcut_dnf: dict[str, DNF] = {}
+        self.location_dnf = {
+            loc_name: self.dnf(expression)
+            for loc_name, expression in self.location_expressions.items()
+        }
+
+    @staticmethod
+    def _lambda_body(node: ast.expr) -> ast.expr:
+        if not (isinstance(node, ast.Lambda) and len(node.args.args) == 1):
+            raise ValueError(f"expected a lambda with 1 parameter on line {node.lineno}")
+        return node.body
+
+    def shortcut_dnf(self, name: str) -> DNF:
+        if name not in self._shortcut_dnf:
+            self._shortcut_dnf[name] = self.dnf(self.shortcut_expressions[name])
+        return self._shortcut_dnf[name]
+
+    def is_shortcut(self, node: ast.expr) -> Optional[str]:
+        """ the shortcut name, if `node` is `shortcut in loadout` """
+        if (
+            isinstance(node, ast.Compare) and
+            len(node.ops) == 1 and isinstance(node.ops[0], ast.In) and
+            isinstance(node.left, ast.Name) and node.left.id in self.shortcut_expressions
+        ):
+            return node.left.id
+        return None
+
+    @staticmethod
+    def conjuncts(node: ast.expr) -> list[ast.expr]:
+        """ the top-level terms of an `and` (or just the node if it's not an `and`) """
+        if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+            return [term for value in node.values for term in LogicAnalysis.conjuncts(value)]
+        return [node]
+
+    def _flat_conjuncts(self, node: ast.expr, keep: Iterable[str]) -> list[ast.expr]:
+        """ `conjuncts`, also expanding shortcuts (except `keep`) that are an `and` """
+        tr: list[ast.expr] = []
+        for term in self.conjuncts(node):
+            shortcut = self.is_shortcut(term)
+            if shortcut and shortcut not in keep:
+                inner = self.conjuncts(self.shortcut_expressions[shortcut])
+                if len(inner) > 1:
+                    tr.extend(self._flat_conjuncts(self.shortcut_expressions[shortcut], keep))
+                    continue
+            tr.append(term)
+        return tr
+
+    def area_graph(self, areas: Sequence[str]) -> AreaGraph:
+        """
+        split rules by these shortcuts (areas)
+
+        An area's parent is an area that its definition requires with `and`.
+        A location goes in the deepest area its rule requires with `and`,
+        and keeps only the rest of its rule (without that area or its ancestors).
+        """
+        area_set = frozenset(areas)
+        graph_areas: dict[str, AreaRequirement] = {}
+        ancestors: dict[Optional[str], frozenset[str]] = {None: frozenset()}
+
+        def split(node: ast.expr) -> AreaRequirement:
+            terms = self._flat_conjuncts(node, area_set)
+            required = [name for name in map(self.is_shortcut, terms) if name in area_set]
+            for name in required:
+                add_area(name)
+            area: Optional[str] = None
+            if required:
+                area = max(required, key=lambda name: len(ancestors[name]))
+            implied = ancestors[area] | ({area} if area else set())
+            rest = [term for term in terms if self.is_shortcut(term) not in implied]
+            return AreaRequirement(area, dnf_and(*(self.dnf(term) for term in rest)))
+
+        def add_area(name: str) -> None:
+            if name in graph_areas:
+                return
+            if name in ancestors:
+                raise ValueError(f"area {name} requires itself")
+            ancestors[name] = frozenset()  # in progress
+            entrance = split(self.shortcut_expressions[name])
+            ancestors[name] = ancestors[entrance.area] | ({entrance.area} if entrance.area else set())
+            graph_areas[name] = entrance
+
+        for area_name in areas:
+            add_area(area_name)
+        graph_locations = {
+            loc_name: split(expression)
+            for loc_name, expression in self.location_expressions.items()
+        }
+        return AreaGraph(graph_areas, graph_locations)
+
+    def _name_dnf(self, name: str, line: int) -> DNF:
+        if name in self._items:
+            return frozenset({frozenset({(self._items[name], 1)})})
+        if name in self.shortcut_expressions:
+            return self.shortcut_dnf(name)
+        raise ValueError(f"unknown name {name} on line {line}")
+
+    def _count_item(self, node: ast.expr) -> Optional[tuple[str, int]]:
+        """ (item name, multiplier) if `node` is `loadout.count(Item)` or `loadout.count(Item) * k` """
+        multiplier = 1
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult):
+            if isinstance(node.right, ast.Constant) and isinstance(node.right.value, int):
+                multiplier = node.right.value
+                node = node.left
+            elif isinstance(node.left, ast.Constant) and isinstance(node.left.value, int):
+                multiplier = node.left.value
+                node = node.right
+            else:
+                return None
+        if (
+            isinstance(node, ast.Call) and
+            isinstance(node.func, ast.Attribute) and node.func.attr == "count" and
+            len(node.args) == 1 and isinstance(node.args[0], ast.Name) and
+            node.args[0].id in self._items
+        ):
+            return self._items[node.args[0].id], multiplier
+        return None
+
+    def dnf(self, node: ast.expr) -> DNF:
+        if isinstance(node, ast.BoolOp):
+            parts = [self.dnf(value) for value in node.values]
+            return dnf_and(*parts) if isinstance(node.op, ast.And) else dnf_or(*parts)
+        if isinstance(node, ast.Constant) and isinstance(node.value, bool):
+            return ALWAYS if node.value else NEVER
+        if isinstance(node, ast.Compare) and len(node.ops) == 1:
+            op = node.ops[0]
+            right = node.comparators[0]
+            if isinstance(op, ast.In) and isinstance(node.left, ast.Name) and isinstance(right, ast.Name):
+                return self._name_dnf(node.left.id, node.lineno)
+            count_item = self._count_item(node.left)
+            if (
+                count_item and
+                isinstance(op, (ast.GtE, ast.Gt)) and
+                isinstance(right, ast.Constant) and isinstance(right.value, int)
+            ):
+                item_name, multiplier = count_item
+                threshold = right.value + 1 if isinstance(op, ast.Gt) else right.value
+                needed = math.ceil(threshold / multiplier)
+                if needed <= 0:
+                    return ALWAYS
+                return frozenset({frozenset({(item_name, needed)})})
+        if (
+            isinstance(node, ast.Call) and
+            isinstance(node.func, ast.Attribute) and node.func.attr in ("has_all", "has_any") and
+            all(isinstance(arg, ast.Name) for arg in node.args)
+        ):
+            parts = [self._name_dnf(arg.id, node.lineno) for arg in node.args if isinstance(arg, ast.Name)]
+            return dnf_and(*parts) if node.func.attr == "has_all" else dnf_or(*parts)
+        raise ValueError(f"logic analysis doesn't understand line {node.lineno}: {ast.unparse(node)}")
+
+    def items_for_location(self, loc_name: str) -> frozenset[str]:
+        """ every item that can matter for this location """
+        return items_in(self.location_dnf[loc_name])
+
+    def locations_using(self, item_name: str) -> list[str]:
+        """ locations whose access can depend on this item """
+        return [
+            loc_name for loc_name, dnf in self.location_dnf.items()
+            if item_name in items_in(dnf)
+        ]
+
+    def free_locations(self) -> list[str]:
+        """ locations that need nothing """
+        return [
+            loc_name for loc_name, dnf in self.location_dnf.items()
+            if dnf == ALWAYS
+        ]
@@ -5,7 +5,8 @@ from .loadout import Loadout
 
 
 def updateLogic(unusedLocations: Iterable[Location], loadout: Loadout) -> Iterable[Location]:
+    accessible = loadout.accessible_locations()
     for thisLoc in unusedLocations:
-        thisLoc['inlogic'] = loadout.game.logic.location_logic[thisLoc['roomname']](loadout)
+        thisLoc['inlogic'] = bool(accessible[thisLoc['index']])
 
     return unusedLocations
@@ -1,10 +1,85 @@
+import asyncio
 import base64
+import binascii
 import enum
+import functools
+import hashlib
+import mmap
 import os
 import pathlib
-from typing import Optional, Union
+import shutil
+import zlib
+from types import TracebackType
+from typing import IO, AsyncIterator, Iterable, Iterator, Optional, Union
 
-from .ips import patch
+from . import instrumentation
+from .ips import patch, records as ips_records
+
+SNES_HEADER_CHECKSUM_COMPLEMENT = 0x7fdc
+""" lorom header - 2 bytes complement, then 2 bytes checksum """
+
+_DIGEST_CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_BASE64_LINE_INPUT = 57
+""" `base64.encodebytes` puts a newline after the encoding of every 57 bytes """
+
+_BASE64_WHITESPACE = b" \t\r\n"
+
+
+class Base64ChunkDecoder:
+    """ decode base64 that arrives in pieces split anywhere (even in the middle of a 4 character group) """
+
+    def __init__(self) -> None:
+        self._pending = b""
+
+    def feed(self, chunk: Union[str, bytes]) -> bytes:
+        """ the data decoded so far from this chunk (and what was left over from the previous one) """
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = self._pending + chunk.translate(None, _BASE64_WHITESPACE)
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        return binascii.a2b_base64(data[:usable])
+
+    def finish(self) -> None:
+        """ raises if the input ended in the middle of a 4 character group """
+        if self._pending:
+            raise ValueError(f"base64 input ended with {len(self._pending)} extra characters")
+
+
+def _mirrored_size(size: int) -> int:
+    """ `size` after the mirroring in `checksum_regions` """
+    power = 1 << (size.bit_length() - 1)
+    return size if size == power else power * 2
+
+
+@functools.lru_cache(maxsize=None)
+def checksum_regions(size: int) -> tuple[tuple[int, int, int], ...]:
+    """
+    ((start, end, weight), ...) - how many times each byte is counted in the SNES checksum
+
+    A rom size that isn't a power of 2 is summed as if the part after
+    the largest power of 2 were mirrored to fill another power of 2.
+    That part is first filled out to its own size the same way (like snes9x `checksum_mirror_sum`).
+    """
+    if size == 0:
+        return ()
+    power = 1 << (size.bit_length() - 1)
+    tr = [(0, power, 1)]
+    rest = size - power
+    if rest:
+        repeat = 1
+        mirrored = _mirrored_size(rest)
+        while mirrored < power:
+            mirrored += mirrored
+            repeat *= 2
+        tr.extend(
+            (power + start, power + end, weight * repeat)
+            for start, end, weight in checksum_regions(rest)
+        )
+    return tuple(tr)
 
 
 class RomWriterType(enum.IntEnum):
@@ -12,6 +87,8 @@ class RomWriterType(enum.IntEnum):
     file = 1
     ipsblob = 2
     base64 = 3
+    mmap = 4
+    """ edits go straight into a memory-mapped output file """
 
 
 class RomWriter:
@@ -22,9 +99,17 @@ class RomWriter:
 
     def __init__(self) -> None:
         self.romWriterType = RomWriterType.null
-        self.rom_data = bytearray()
+        self.rom_data: Union[bytearray, mmap.mmap] = bytearray()
         self.ipsblob = bytearray()
         self.baseFilename = ''
+        self._mappedFile: Optional[IO[bytes]] = None
+        self._mappedPath: Optional[str] = None
+        self.romSum: Optional[int] = None
+        """ weighted sum of `rom_data` for the SNES checksum - `None` if not tracking it (see `trackChecksum`) """
+        self.md5: Optional[str] = None
+        """ of the output - set by `finalizeRom` """
+        self.crc32: Optional[int] = None
+        """ of the output - set by `finalizeRom` """
 
     @classmethod
     def fromFilePath(cls, origRomPath: str) -> "RomWriter":
@@ -34,6 +119,39 @@ class RomWriter:
         instance.patch_if_vanilla()
         return instance
 
+    @classmethod
+    def fromRomData(cls, rom_data: Union[bytes, bytearray]) -> "RomWriter":
+        """ a copy of rom data that's already in memory (already patched to Cliffhanger Redux) """
+        instance = cls()
+        instance.romWriterType = RomWriterType.file
+        instance.rom_data = bytearray(rom_data)
+        return instance
+
+    @classmethod
+    def fromMappedCopy(cls, source: Union[str, bytes, bytearray, memoryview], outputPath: str) -> "RomWriter":
+        """
+        copy an already patched rom (a file path, or the data) to `outputPath`,
+        then edit that file in place through a memory map
+
+        `finalizeRom()` flushes and closes it, `discard()` closes and removes it
+        (or use it as a context manager, to discard it if there's an exception before `finalizeRom()`)
+        """
+        instance = cls()
+        instance.romWriterType = RomWriterType.mmap
+        instance._mappedPath = outputPath
+        try:
+            if isinstance(source, str):
+                RomWriter.copyFile(source, outputPath)
+            else:
+                with open(outputPath, 'wb') as output:
+                    output.write(source)
+            instance._mappedFile = open(outputPath, 'r+b')
+            instance.rom_data = mmap.mmap(instance._mappedFile.fileno(), 0)
+        except BaseException:
+            instance.discard()
+            raise
+        return instance
+
     @classmethod
     def fromBlankIps(cls) -> "RomWriter":
         instance = cls()
@@ -48,6 +166,19 @@ class RomWriter:
         instance.rom_data = bytearray(base64.decodebytes(b64str.encode() if isinstance(b64str, str) else b64str))
         return instance
 
+    @classmethod
+    def fromBase64Chunks(cls, chunks: Iterable[Union[str, bytes]]) -> "RomWriter":
+        """ like `fromBase64`, without the whole base64 string in memory """
+        instance = cls()
+        instance.romWriterType = RomWriterType.base64
+        decoder = Base64ChunkDecoder()
+        rom_data = bytearray()
+        for chunk in chunks:
+            rom_data.extend(decoder.feed(chunk))
+        decoder.finish()
+        instance.rom_data = rom_data
+        return instance
+
     @staticmethod
     def index_to_snes_addr(i: int) -> int:
         """ converts a PC rom offset to a SNES lorom address """
@@ -70,7 +201,20 @@ class RomWriter:
             return bytearray(orig.read())
 
     @staticmethod
-    def isAllRepeatedBytes(data: bytes) -> bool:
+    def copyFile(origFile: str, destFile: str) -> None:
+        """ reflink if the file system supports it, otherwise `shutil.copyfile` (which uses sendfile where it can) """
+        try:
+            import fcntl
+            ficlone = 0x40049409  # linux FICLONE ioctl
+            with open(origFile, 'rb') as orig, open(destFile, 'wb') as dest:
+                fcntl.ioctl(dest.fileno(), ficlone, orig.fileno())
+            return
+        except (ImportError, OSError):
+            pass
+        shutil.copyfile(origFile, destFile)
+
+    @staticmethod
+    def isAllRepeatedBytes(data: Union[bytes, bytearray, memoryview]) -> bool:
         if len(data) < 2:
             return False
         byte = data[0]
@@ -79,11 +223,56 @@ class RomWriter:
                 return False
         return True
 
-    def writeBytes(self, address: int, data: bytes) -> None:
-        if self.romWriterType in {RomWriterType.file, RomWriterType.base64}:
+    def weightedSum(self, data: Union[bytes, bytearray, memoryview, mmap.mmap], address: int) -> int:
+        """ what `data` at `address` adds to the SNES checksum """
+        end = address + len(data)
+        tr = 0
+        for start, stop, weight in checksum_regions(len(self.rom_data)):
+            low = max(start, address)
+            high = min(stop, end)
+            if low < high:
+                tr += sum(data[low - address:high - address]) * weight
+        return tr
+
+    def trackChecksum(self, romSum: Optional[int] = None) -> None:
+        """
+        keep the SNES checksum up to date through `writeBytes`, and write it in `finalizeRom`
+
+        `romSum` is a `romSum` already known for the current `rom_data` (otherwise it's summed now)
+        """
+        if self.romWriterType not in {RomWriterType.file, RomWriterType.base64, RomWriterType.mmap}:
+            raise ValueError(f"no rom data to checksum in {self.romWriterType.name} RomWriter")
+        self.romSum = self.weightedSum(self.rom_data, 0) if romSum is None else romSum
+
+    def writeChecksum(self) -> None:
+        """ SNES header checksum and complement from `romSum` """
+        assert self.romSum is not None, "trackChecksum() first"
+        # any checksum and its complement add up to the same as these bytes
+        placeholder = b"\xff\xff\x00\x00"
+        fields = self.rom_data[SNES_HEADER_CHECKSUM_COMPLEMENT:SNES_HEADER_CHECKSUM_COMPLEMENT + 4]
+        checksum = (
+            self.romSum -
+            self.weightedSum(fields, SNES_HEADER_CHECKSUM_COMPLEMENT) +
+            self.weightedSum(placeholder, SNES_HEADER_CHECKSUM_COMPLEMENT)
+        ) & 0xffff
+        self.writeBytes(SNES_HEADER_CHECKSUM_COMPLEMENT,
+                        (checksum ^ 0xffff).to_bytes(2, "little") + checksum.to_bytes(2, "little"))
+
+    def writeBytes(self, address: int, data: Union[bytes, bytearray, memoryview]) -> None:
+        if instrumentation.enabled:
+            instrumentation.count("RomWriter.writeBytes", self.romWriterType.name)
+        if self.romWriterType in {RomWriterType.file, RomWriterType.base64, RomWriterType.mmap}:
             assert len(self.rom_data) >= address + len(data)
+            if self.romSum is not None:
+                self.romSum += (
+                    self.weightedSum(data, address) -
+                    self.weightedSum(self.rom_data[address:address + len(data)], address)
+                )
             self.rom_data[address:address + len(data)] = data
         elif self.romWriterType == RomWriterType.ipsblob:
+            if len(data) == 0:
+                # a 0 size record would be read as RLE
+                return
             if len(data) >= 65536:
                 raise Exception(f'data length {len(data)} exceeds max IPS len of 65536')
             self.ipsblob.extend(address.to_bytes(3, 'big'))
@@ -99,6 +288,11 @@ class RomWriter:
         else:
             raise ValueError(f"invalid rom writer type: {self.romWriterType}")
 
+    def applyIps(self, patch_bytes: bytes) -> None:
+        """ each record of an IPS patch through `writeBytes` """
+        for offset, data in ips_records(patch_bytes):
+            self.writeBytes(offset, data)
+
     def writeItem(self, address: int, plmid: bytes, ammoAmount: bytes = b"\x00") -> None:
         if len(plmid) != 2 or len(ammoAmount) != 1:
             raise Exception(f'plmid length ({len(plmid)}) must be 2 and ammoAmount '
@@ -107,14 +301,73 @@ class RomWriter:
         self.writeBytes(address + 5, ammoAmount)
 
     def finalizeRom(self, filename: Optional[str] = None) -> None:
+        """
+        file: writes `filename` (or with no `filename`, only the checksum and digests)
+        mmap: flushes and closes the output file
+
+        also writes the SNES checksum if `trackChecksum` was called,
+        and sets `md5` and `crc32` of the output in the same pass as writing it
+        """
+        if self.romSum is not None:
+            self.writeChecksum()
         if self.romWriterType == RomWriterType.file:
-            assert filename
-            with open(filename, "wb") as file:
-                file.write(self.rom_data)
+            if filename:
+                with open(filename, "wb") as file:
+                    self._digest(file)
+            else:
+                self._digest()
         elif self.romWriterType == RomWriterType.ipsblob:
             self.ipsblob.extend(b'EOF')
         elif self.romWriterType == RomWriterType.base64:
             pass
+        elif self.romWriterType == RomWriterType.mmap:
+            assert isinstance(self.rom_data, mmap.mmap)
+            assert self._mappedFile
+            self.rom_data.flush()
+            self._digest()
+            self.rom_data.close()
+            self._mappedFile.close()
+            self._mappedFile = None
+            self._mappedPath = None
+
+    def discard(self) -> None:
+        """ mmap: closes and removes the output file, if it wasn't finalized """
+        if self._mappedPath is None:
+            return
+        if isinstance(self.rom_data, mmap.mmap):
+            self.rom_data.close()
+        self.rom_data = bytearray()
+        if self._mappedFile:
+            self._mappedFile.close()
+            self._mappedFile = None
+        try:
+            os.unlink(self._mappedPath)
+        except FileNotFoundError:
+            pass
+        self._mappedPath = None
+
+    def __enter__(self) -> "RomWriter":
+        return self
+
+    def __exit__(self, exc_type: Optional[type[BaseException]], exc: Optional[BaseException],
+                 tb: Optional[TracebackType]) -> None:
+        if exc_type is not None:
+            self.discard()
+
+    def _digest(self, file: Optional[IO[bytes]] = None) -> None:
+        """ md5 and crc32 of `rom_data` (writing it to `file` on the way) """
+        md5 = hashlib.md5()
+        crc = 0
+        with memoryview(self.rom_data) as view:
+            for start in range(0, len(view), _DIGEST_CHUNK_SIZE):
+                chunk = view[start:start + _DIGEST_CHUNK_SIZE]
+                if file:
+                    file.write(chunk)
+                md5.update(chunk)
+                crc = zlib.crc32(chunk, crc)
+                chunk.release()
+        self.md5 = md5.hexdigest()
+        self.crc32 = crc
 
     def getFinalIps(self) -> bytearray:
         if self.romWriterType != RomWriterType.ipsblob:
@@ -128,6 +381,41 @@ class RomWriter:
             raise ValueError('getBase64RomData() called on ipsblob-typed RomWriter')
         return base64.encodebytes(self.rom_data)
 
+    def iterRomData(self, chunkSize: int = DEFAULT_CHUNK_SIZE) -> Iterator[memoryview]:
+        """ the rom in pieces of `chunkSize` - views of `rom_data`, not copies (so don't write while using them) """
+        if self.romWriterType == RomWriterType.ipsblob:
+            raise ValueError('iterRomData() called on ipsblob-typed RomWriter')
+        with memoryview(self.rom_data) as view:
+            for start in range(0, len(view), chunkSize):
+                with view[start:start + chunkSize] as chunk:
+                    yield chunk
+
+    def iterBase64RomData(self, chunkSize: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        `getBase64RomData` in pieces (joined, they're the same)
+
+        each piece encodes about `chunkSize` bytes of the rom (rounded to whole lines of the encoding)
+        """
+        if self.romWriterType == RomWriterType.ipsblob:
+            raise ValueError('iterBase64RomData() called on ipsblob-typed RomWriter')
+        lineAligned = max(_BASE64_LINE_INPUT, chunkSize - chunkSize % _BASE64_LINE_INPUT)
+        for chunk in self.iterRomData(lineAligned):
+            yield base64.encodebytes(chunk)
+
+    async def aiterRomData(self,
+                           chunkSize: int = DEFAULT_CHUNK_SIZE,
+                           base64Encoded: bool = False) -> AsyncIterator[bytes]:
+        """
+        `iterRomData` or `iterBase64RomData` for an async response body
+
+        The chunks are copies, so they stay valid while the response is waiting to send them.
+        """
+        chunks = self.iterBase64RomData(chunkSize) if base64Encoded else self.iterRomData(chunkSize)
+        for chunk in chunks:
+            yield bytes(chunk)
+            # let other requests run between chunks
+            await asyncio.sleep(0)
+
     def setBaseFilename(self, baseFilename: str) -> None:
         self.baseFilename = baseFilename
 
@@ -1,5 +1,6 @@
 from typing import Optional
 
+from . import instrumentation
 from .game import Game
 from .item import Items
 from .loadout import Loadout
@@ -33,6 +34,8 @@ _progression_items = frozenset([
 
 def solve(game: Game, starting_items: Optional[Loadout] = None) -> tuple[bool, list[str], list[Location]]:
     """ returns (completable, spoiler lines, accessible locations) """
+    if instrumentation.enabled:
+        instrumentation.count("solve", "calls")
     for loc in game.all_locations.values():
         loc["inlogic"] = False
 
@@ -50,6 +53,8 @@ def solve(game: Game, starting_items: Optional[Loadout] = None) -> tuple[bool, l
     while not stuck:
         prev_loadout_count = len(loadout)
         updateLogic(unused_locations, loadout)
+        if instrumentation.enabled:
+            instrumentation.count("solve", "spheres")
         log_lines.append("sphere:")
         for loc in unused_locations:
             if loc["inlogic"]:
@@ -7,6 +7,8 @@ import sys
 from typing import IO, Any, Literal, Tuple, Union, overload
 import zipfile
 
+from .lazy import Lazy
+
 base_id = 8760000
 
 # support for AP world (somewhat copied from SM)
@@ -18,13 +20,21 @@ def is_apworld() -> bool:
     return _is_apworld
 
 
-def _get_zip_file() -> Tuple[zipfile.ZipFile, str]:
+def _open_zip_file() -> Tuple[zipfile.ZipFile, str]:
     apworld_ext = ".apworld"
     assert _module_file_name
     zip_path = pathlib.Path(_module_file_name[:_module_file_name.index(apworld_ext) + len(apworld_ext)])
     return (zipfile.ZipFile(zip_path), zip_path.stem)
 
 
+_zip_file: Lazy[Tuple[zipfile.ZipFile, str]] = Lazy("apworld zip", _open_zip_file)
+
+
+def _get_zip_file() -> Tuple[zipfile.ZipFile, str]:
+    """ opened once and shared (reading members from more than one thread is ok) - don't close or change it """
+    return _zip_file.get()
+
+
 @overload
 def open_file_apworld_compatible(
     resource: Union[str, pathlib.Path], mode: Literal["rb"], encoding: None = None
@@ -47,13 +57,12 @@ def open_file_apworld_compatible(
             resource = resource.as_posix()
         else:
             resource = resource.replace("\\", "/")
-        with zip_file as zf:
-            zip_file_path = resource[resource.index(stem + "/"):]
-            if mode == 'rb':
-                return zf.open(zip_file_path, 'r')
-            else:
-                assert mode == 'r' or mode == 'w', f"{mode=}"
-                return io.TextIOWrapper(zf.open(zip_file_path, mode), encoding)
+        zip_file_path = resource[resource.index(stem + "/"):]
+        if mode == 'rb':
+            return zip_file.open(zip_file_path, 'r')
+        else:
+            assert mode == 'r' or mode == 'w', f"{mode=}"
+            return io.TextIOWrapper(zip_file.open(zip_file_path, mode), encoding)
     else:
         return open(resource, mode)
 
@@ -87,13 +96,15 @@ def exists_apworld_compatible(resource: str) -> bool:
 def load_library() -> None:
     from Utils import user_path
 
-    (zip_file, _stem) = _get_zip_file()
+    # not the shared zip file, because this renames its members
+    (zip_file, _stem) = _open_zip_file()
     logging.info("loading cliff_redux_randomizer library...")
-    for file in zip_file.namelist():
-        if file.startswith('cliffredux/cliff_redux_randomizer/'):
-            new_path = file[13:]
-            zip_file.getinfo(file).filename = new_path
-            zip_file.extract(file, user_path('lib'))
+    with zip_file:
+        for file in zip_file.namelist():
+            if file.startswith('cliffredux/cliff_redux_randomizer/'):
+                new_path = file[13:]
+                zip_file.getinfo(file).filename = new_path
+                zip_file.extract(file, user_path('lib'))
 
 
 if is_apworld():
@@ -0,0 +1,53 @@
+"""
+values made the first time they're needed, once, even when output threads ask at the same time
+
+(no imports from the rest of the world, so anything can use this)
+"""
+import threading
+from typing import Callable, Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+_all: List["Lazy[object]"] = []
+
+
+class Lazy(Generic[T]):
+    """
+    `get()` makes the value with `make` the first time, and returns the same value after that
+
+    Each has its own lock, so making one doesn't wait for making another (unless it uses the other).
+    After it's made, `get()` doesn't take the lock.
+    """
+    name: str
+    loads: int
+    """ how many times it was made - should never be more than 1 """
+
+    def __init__(self, name: str, make: Optional[Callable[[], T]] = None) -> None:
+        self.name = name
+        self.loads = 0
+        self._make = make
+        self._lock = threading.Lock()
+        self._ready = False
+        self._value: Optional[T] = None
+        _all.append(self)  # type: ignore
+
+    def get(self, make: Optional[Callable[[], T]] = None) -> T:
+        """ `make` instead of the one given to the constructor, if this is the first time """
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    make = make or self._make
+                    assert make, f"nothing to make {self.name} with"
+                    self._value = make()
+                    self.loads += 1
+                    self._ready = True
+        return self._value  # type: ignore
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+
+def all_lazy() -> List["Lazy[object]"]:
+    """ every `Lazy` that has been created """
+    return list(_all)
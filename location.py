@@ -1,11 +1,12 @@
-from typing import Optional
+from typing import Dict, Optional
 
 from BaseClasses import Location, Region
+from . import prebuilt
 from .config import base_id
 
 from .cliff_redux_randomizer.location import Location as CrLocation, pullCSV
 
-location_data = pullCSV()
+location_data: Dict[str, CrLocation] = prebuilt.load("locations") or pullCSV()
 
 id_to_name = {
     loc["index"] + base_id: loc_name
@@ -0,0 +1,41 @@
+"""
+the parts of the logic that come from analyzing `defaultLogic` (slow - it parses the source)
+
+`make_apworld.py` builds these into the prebuilt tables, so loading the apworld doesn't analyze the logic.
+
+(no Archipelago imports, so `make_apworld.py` can run this)
+"""
+from typing import Any, Dict
+
+from .cliff_redux_randomizer.loadout import Loadout
+from .cliff_redux_randomizer.logic_analysis import AreaGraph, DNF
+
+AREAS = ("redTower", "blueTower", "upperNorfair", "wsBack", "brin", "castle", "ln")
+""" shortcuts that are used as Archipelago regions """
+
+WIN_SHORTCUTS = ("phantoon", "ridley", "blueTower", "gt")
+""" the `defaultLogic` shortcuts that are needed to win """
+
+
+def can_win(loadout: Loadout) -> bool:
+    """ the win condition - `can_win_dnf` is the analysis of this """
+    from .cliff_redux_randomizer import defaultLogic
+
+    return all(getattr(defaultLogic, name) in loadout for name in WIN_SHORTCUTS)
+
+
+def build() -> Dict[str, Any]:
+    """ {"area_graph": `AreaGraph.to_tables`, "can_win_dnf": DNF} """
+    from .cliff_redux_randomizer import defaultLogic
+    from .cliff_redux_randomizer.logic_analysis import LogicAnalysis, dnf_and
+
+    logic_analysis = LogicAnalysis(defaultLogic)
+    can_win_dnf: DNF = dnf_and(*(logic_analysis.shortcut_dnf(name) for name in WIN_SHORTCUTS))
+    return {
+        "area_graph": logic_analysis.area_graph(AREAS).to_tables(),
+        "can_win_dnf": can_win_dnf,
+    }
+
+
+def get_area_graph(tables: Dict[str, Any]) -> AreaGraph:
+    return AreaGraph.from_tables(tables["area_graph"])
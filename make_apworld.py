@@ -1,6 +1,12 @@
 # a script for creating the apworld
 # (This is not a module for Archipelago. This is a stand-alone script.)
+import compileall
+import importlib
+import json
 import os
+import py_compile
+import sys
+import types
 import zlib
 from shutil import copytree, rmtree, make_archive
 
@@ -9,6 +15,9 @@ from shutil import copytree, rmtree, make_archive
 # directory "SuperJunkoidRandomizer" (with the correct version) needs to be a sibling to "Archipelago"
 # This does not verify the version.
 
+# The .pyc files and prebuilt tables are for the version of Python running this script.
+# Run it with the same Python version that Archipelago uses. (With another version, they're ignored.)
+
 ORIG = "cliffredux"
 TEMP = "cliffredux_temp"
 MOVE = "cliffredux_move"
@@ -36,6 +45,9 @@ copytree(ORIG, TEMP)
 if os.path.exists(os.path.join(TEMP, "__pycache__")):
     rmtree(os.path.join(TEMP, "__pycache__"))
 
+# a stress check that runs for a while - not for the apworld
+os.unlink(os.path.join(TEMP, "test", "test_stress_lazy.py"))
+
 copytree(cliff_redux_randomizer_dir, os.path.join(TEMP, "cliff_redux_randomizer"))
 
 if os.path.exists(os.path.join(TEMP, "cliff_redux_randomizer", "__pycache__")):
@@ -59,6 +71,51 @@ with open(os.path.join(TEMP, "cliff_redux_randomizer", "crc"), "w") as crc_file:
 with open(os.path.join(TEMP, "lib_crc.py"), "w") as crc_module:
     crc_module.write(f"crc = {crc}\n")
 
+
+def prebuilt_tables() -> None:
+    """ locations, symbols, and logic analysis, so they're not parsed from csv, json, and source when loading """
+    # a package for TEMP without running its __init__ (which needs Archipelago)
+    package = types.ModuleType("cliffredux_build")
+    package.__path__ = [os.path.abspath(TEMP)]
+    sys.modules["cliffredux_build"] = package
+    prebuilt = importlib.import_module("cliffredux_build.prebuilt")
+    logic_tables = importlib.import_module("cliffredux_build.logic_tables")
+
+    sys.path.insert(0, TEMP)
+    try:
+        from cliff_redux_randomizer.location import pullCSV
+        locations = pullCSV()
+    finally:
+        sys.path.remove(TEMP)
+    with open(os.path.join(TEMP, "data", "ap_cliff_redux_patch", "sm-basepatch-symbols.json")) as symbols_file:
+        symbols = json.load(symbols_file)
+
+    with open(os.path.join(TEMP, prebuilt.FILE_NAME), "wb") as tables_file:
+        tables_file.write(prebuilt.build({"locations": locations, "symbols": symbols, "logic": logic_tables.build()}))
+    for name in ("cliff_redux_randomizer", "cliff_redux_randomizer.location", "cliff_redux_randomizer.item"):
+        sys.modules.pop(name, None)
+
+
+def compile_bytecode() -> None:
+    """
+    hash-checked .pyc (still correct if file times change when extracting from the zip)
+
+    next to each source for zipimport (which tries .pyc before .py, and skips it if the magic number is different)
+    and in __pycache__ for the library extracted to lib/
+    """
+    for legacy in (True, False):
+        assert compileall.compile_dir(
+            TEMP,
+            quiet=1,
+            legacy=legacy,
+            optimize=0,
+            invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
+        ), "compile failed"
+
+
+prebuilt_tables()
+compile_bytecode()
+
 zip_file_name = make_archive("cliffredux", "zip", ".", TEMP)
 print(f"{zip_file_name} -> {destination}")
 os.rename(zip_file_name, destination)
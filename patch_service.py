@@ -0,0 +1,265 @@
+"""
+long-running local service for patching many Cliffhanger Redux roms
+
+run from the Archipelago directory:
+    python -m worlds.cliffredux.patch_service --socket /tmp/cliffredux.sock
+    python -m worlds.cliffredux.patch_service --port 38290
+
+The base rom, symbols, and base patched image are loaded once,
+in the service and in each worker process, so a patch only does the seed's writes.
+
+protocol (any number of requests on one connection):
+    request:  one json line `{"input": "apcr" | "gen_data", "output": "rom" | "ips", "length": n}`
+              followed by n bytes (the .apcr file or the `rom_data.json` text)
+              or just the json line `{"command": "metrics"}`
+    response: one json line `{"ok": true, "output": ..., "length": n, ...}` followed by n bytes
+              or `{"ok": false, "error": ...}`
+A "rom" response also has the "md5" and "crc32" of the rom.
+An "ips" output is a patch to apply to the base patched rom (`get_base_patched_rom_bytes`),
+not to the vanilla rom, and it doesn't update the SNES checksum.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from .cliff_redux_randomizer.romWriter import RomWriter
+from .patch_utils import get_gen_data, offset_from_symbol
+from .rom import get_base_patched_rom_bytes, get_base_patched_rom_sum, item_plm_table, make_seed_ips, \
+    write_seed_data
+
+logger = logging.getLogger("Cliffhanger Redux patch service")
+
+MAX_REQUEST_SIZE = 16 * 1024 * 1024
+""" bytes - an .apcr is much smaller than this """
+RESPONSE_CHUNK_SIZE = 256 * 1024
+""" bytes written before waiting for the client to read them """
+
+
+def warm_up() -> None:
+    """ load everything that's the same for every patch (worker pool initializer) """
+    get_base_patched_rom_bytes()
+    get_base_patched_rom_sum()
+    offset_from_symbol("config_player_id")
+    item_plm_table()
+
+
+def gen_data_from_container(apcr_data: bytes) -> str:
+    """ the `rom_data.json` from the bytes of an .apcr file """
+    with zipfile.ZipFile(io.BytesIO(apcr_data)) as opened_zipfile:
+        return opened_zipfile.read("rom_data.json").decode()
+
+
+def patch_gen_data(gen_data_str: str, output: str) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    worker - the whole rom, or ("ips") a patch to the base patched rom
+
+    and what to add to the response header (digests of the rom)
+    """
+    gen_data = get_gen_data(gen_data_str)
+    if output == "ips":
+        return make_seed_ips(gen_data), {}
+    rom_writer = RomWriter.fromRomData(get_base_patched_rom_bytes())
+    rom_writer.trackChecksum(get_base_patched_rom_sum())
+    write_seed_data(rom_writer, gen_data)
+    rom_writer.finalizeRom()
+    return bytes(rom_writer.rom_data), {"md5": rom_writer.md5, "crc32": rom_writer.crc32}
+
+
+@dataclass
+class ServiceMetrics:
+    requests: int = 0
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    """ turned away because the queue was full """
+    queued: int = 0
+    """ waiting for a worker now """
+    running: int = 0
+    max_queued: int = 0
+    queue_seconds: float = 0.0
+    """ total time requests spent waiting for a worker """
+    patch_seconds: float = 0.0
+    """ total time requests spent in a worker """
+    bytes_sent: int = 0
+
+    def to_jsonable(self) -> Dict[str, Any]:
+        tr: Dict[str, Any] = asdict(self)
+        finished = self.completed + self.failed
+        tr["mean_queue_seconds"] = self.queue_seconds / finished if finished else 0.0
+        tr["mean_patch_seconds"] = self.patch_seconds / finished if finished else 0.0
+        return tr
+
+
+class PatchService:
+    """ asyncio server handing patches to a process pool """
+
+    def __init__(self, workers: Optional[int] = None, max_queue: int = 256) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        """ requests waiting for a worker before new ones are rejected """
+        self.metrics = ServiceMetrics()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def start_workers(self) -> None:
+        """ in the event loop that will serve (before Python 3.10, the semaphore is tied to the loop it's made in) """
+        # loaded here first, so forked workers start with it
+        warm_up()
+        self._executor = ProcessPoolExecutor(self.workers, initializer=warm_up)
+        self._slots = asyncio.Semaphore(self.workers)
+
+    def shutdown(self) -> None:
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def patch(self, gen_data_str: str, output: str) -> Tuple[bytes, Dict[str, Any]]:
+        """ raises `OverflowError` if the queue is full """
+        assert self._executor and self._slots, "start_workers() first"
+        slots = self._slots
+        metrics = self.metrics
+        if metrics.queued >= self.max_queue:
+            metrics.rejected += 1
+            raise OverflowError(f"queue full ({self.max_queue} waiting)")
+        metrics.queued += 1
+        metrics.max_queued = max(metrics.max_queued, metrics.queued)
+        queue_start = time.perf_counter()
+        try:
+            await slots.acquire()
+        finally:
+            metrics.queued -= 1
+            metrics.queue_seconds += time.perf_counter() - queue_start
+        metrics.running += 1
+        patch_start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor, patch_gen_data, gen_data_str, output)
+        except Exception:
+            metrics.failed += 1
+            raise
+        finally:
+            metrics.running -= 1
+            metrics.patch_seconds += time.perf_counter() - patch_start
+            slots.release()
+        metrics.completed += 1
+        return result
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                header_line = await reader.readline()
+                if not header_line:
+                    break
+                header, body = await self._read_request(header_line, reader)
+                response, data = await self._respond(header, body)
+                response["length"] = len(data)
+                writer.write(json.dumps(response).encode() + b"\n")
+                for start in range(0, len(data), RESPONSE_CHUNK_SIZE):
+                    writer.write(data[start:start + RESPONSE_CHUNK_SIZE])
+                    await writer.drain()
+                await writer.drain()
+                self.metrics.bytes_sent += len(data)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.info(f"connection closed: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(header_line: bytes, reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], bytes]:
+        try:
+            header = json.loads(header_line)
+        except ValueError:
+            return {}, b""
+        if not isinstance(header, dict):
+            return {}, b""
+        length = header.get("length", 0)
+        if not isinstance(length, int) or not 0 <= length <= MAX_REQUEST_SIZE:
+            # can't know where the next request starts
+            raise ConnectionError(f"invalid request length {length!r}")
+        return header, await reader.readexactly(length)
+
+    async def _respond(self, header: Dict[str, Any], body: bytes) -> Tuple[Dict[str, Any], bytes]:
+        """ (response header, response data) """
+        if header.get("command") == "metrics":
+            return {"ok": True, "metrics": self.metrics.to_jsonable()}, b""
+        input_type = header.get("input")
+        output = header.get("output", "rom")
+        if input_type not in ("apcr", "gen_data") or output not in ("rom", "ips"):
+            return {"ok": False, "error": f"invalid request {header!r}"}, b""
+        self.metrics.requests += 1
+        start = time.perf_counter()
+        try:
+            gen_data_str = gen_data_from_container(body) if input_type == "apcr" else body.decode()
+            data, extra = await self.patch(gen_data_str, output)
+        except OverflowError as e:
+            return {"ok": False, "error": str(e), "busy": True}, b""
+        except Exception as e:
+            logger.exception("patch failed")
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}, b""
+        return {"ok": True, "output": output, "seconds": time.perf_counter() - start, **extra}, data
+
+
+async def serve(service: PatchService,
+                socket_path: Optional[str] = None,
+                host: str = "127.0.0.1",
+                port: int = 38290) -> None:
+    """ until cancelled - a unix socket if `socket_path` is given, otherwise localhost tcp """
+    service.start_workers()
+    try:
+        if socket_path:
+            server = await asyncio.start_unix_server(service.handle_connection, socket_path)
+        else:
+            server = await asyncio.start_server(service.handle_connection, host, port)
+        logger.info(f"Cliffhanger Redux patch service listening on {socket_path or f'{host}:{port}'}"
+                    f" with {service.workers} workers")
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.shutdown()
+        logger.info(f"patch service metrics: {json.dumps(service.metrics.to_jsonable())}")
+
+
+async def request_patch(reader: asyncio.StreamReader,
+                        writer: asyncio.StreamWriter,
+                        data: bytes,
+                        input_type: str = "apcr",
+                        output: str = "rom") -> bytes:
+    """ client side of one request on an open connection - raises `RuntimeError` if the service fails """
+    header = {"input": input_type, "output": output, "length": len(data)}
+    writer.write(json.dumps(header).encode() + b"\n")
+    writer.write(data)
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    if not response.get("ok"):
+        raise RuntimeError(f"patch service: {response.get('error')}")
+    return await reader.readexactly(response["length"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cliffhanger Redux patch service")
+    parser.add_argument("--socket", default=None, help="unix socket path (default: localhost tcp)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=38290)
+    parser.add_argument("--workers", type=int, default=None, help="default: number of cpus")
+    parser.add_argument("--max-queue", type=int, default=256,
+                        help="requests waiting for a worker before new ones are rejected")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    service = PatchService(args.workers, args.max_queue)
+    try:
+        asyncio.run(serve(service, args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
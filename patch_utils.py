@@ -1,18 +1,22 @@
+import base64
 import json
+from collections import defaultdict
 from dataclasses import dataclass
 from enum import IntEnum
 from itertools import chain
-from typing import Final, List, Set, Mapping, Tuple, Dict, Union, Optional
+import struct
+from typing import Final, Iterable, List, Set, Mapping, Tuple, Dict, Union, Optional
 from pathlib import Path
 
 from .cliff_redux_randomizer.romWriter import RomWriter
 
 from BaseClasses import Location, ItemClassification
 from .location import CliffReduxLocation
+from . import prebuilt
 from .config import base_id, open_file_apworld_compatible
+from .lazy import Lazy
 from .item import local_id_to_cliff_item, CliffReduxItem
 
-from .cliff_redux_randomizer.game import Game as CrGame
 from .cliff_redux_randomizer.ips import patch as ips_patch
 
 
@@ -71,37 +75,52 @@ def get_word_array(w: int) -> Tuple[int, int]:
     return w & 0x00FF, (w & 0xFF00) >> 8
 
 
-def make_item_name_for_rom(item_name: str) -> bytearray:
-    """ 64 bytes (32 chars) centered, encoded with box_blue.tbl """
-    data = bytearray()
+_box_blue_low = bytes(box_blue_tbl.get(chr(i), 0x2C0F) & 0xFF for i in range(256))
+_box_blue_high = bytes(box_blue_tbl.get(chr(i), 0x2C0F) >> 8 for i in range(256))
+""" `bytes.translate` tables for the 2 bytes of each box_blue.tbl character (unknown characters are space) """
 
+ITEM_NAME_ROM_SIZE = 64
+
+
+def _item_name_text(item_name: str) -> str:
+    """ the 32 characters that show in the rom for this item name """
     item_name = item_name.upper()[:26]
     item_name = item_name.strip()
     item_name = item_name.center(26, " ")
     item_name = "___" + item_name + "___"
     assert len(item_name) == 32, f"{len(item_name)=}"
+    return item_name
+
+
+def _write_item_name_text(buffer: bytearray, offset: int, text: str) -> None:
+    if not text.isascii():
+        # not in box_blue.tbl, same as space
+        text = "".join(char if char.isascii() else " " for char in text)
+    encoded = text.encode("ascii")
+    buffer[offset:offset + ITEM_NAME_ROM_SIZE:2] = encoded.translate(_box_blue_low)
+    buffer[offset + 1:offset + ITEM_NAME_ROM_SIZE:2] = encoded.translate(_box_blue_high)
+
+
+def get_symbols_path() -> Path:
+    """ sm-basepatch-symbols.json """
+    path = Path(__file__).parent.resolve()
+    return path.joinpath("data", "ap_cliff_redux_patch", "sm-basepatch-symbols.json")
+
 
-    for char in item_name:
-        w0, w1 = get_word_array(box_blue_tbl.get(char, 0x2C0F))
-        data.append(w0)
-        data.append(w1)
-    assert len(data) == 64, f"{len(data)=}"
-    return data
+def _load_symbols() -> Dict[str, str]:
+    symbols: Optional[Dict[str, str]] = prebuilt.load("symbols")
+    if symbols is None:
+        with open_file_apworld_compatible(get_symbols_path()) as symbols_file:
+            symbols = json.load(symbols_file)
+    assert symbols
+    return symbols
 
 
-_symbols: Optional[Dict[str, str]] = None
+_symbols: Lazy[Dict[str, str]] = Lazy("symbols", _load_symbols)
 
 
 def offset_from_symbol(symbol: str) -> int:
-    global _symbols
-    if _symbols is None:
-        path = Path(__file__).parent.resolve()
-        json_path = path.joinpath("data", "ap_cliff_redux_patch", "sm-basepatch-symbols.json")
-        with open_file_apworld_compatible(json_path) as symbols_file:
-            _symbols = json.load(symbols_file)
-        assert _symbols
-
-    snes_addr_str = _symbols[symbol]
+    snes_addr_str = _symbols.get()[symbol]
     snes_addr_str = "".join(snes_addr_str.split(":"))
     snes_addr = int(snes_addr_str, 16)
     offset = RomWriter.snes_to_index_addr(snes_addr)
@@ -122,6 +141,16 @@ _item_sprites = [
 ]
 
 
+def get_item_sprite_path(file_name: str) -> Path:
+    path = Path(__file__).parent.resolve()
+    return path.joinpath("data", "custom_sprite", file_name)
+
+
+def get_item_sprite_paths() -> List[Path]:
+    """ the files that `patch_item_sprites` reads """
+    return [get_item_sprite_path(item_sprite["fileName"]) for item_sprite in _item_sprites]
+
+
 def patch_item_sprites(rom: Union[bytes, bytearray]) -> bytearray:
     """
     puts the 2 new off-world item sprites in the rom
@@ -130,14 +159,10 @@ def patch_item_sprites(rom: Union[bytes, bytearray]) -> bytearray:
     """
     tr = bytearray(rom)
 
-    path = Path(__file__).parent.resolve()
-
     for item_sprite in _item_sprites:
         palette_offset = offset_from_symbol(item_sprite["paletteSymbolName"])
         data_offset = offset_from_symbol(item_sprite["dataSymbolName"])
-        with open_file_apworld_compatible(
-            path.joinpath("data", "custom_sprite", item_sprite["fileName"]), 'rb'
-        ) as file:
+        with open_file_apworld_compatible(get_item_sprite_path(item_sprite["fileName"]), 'rb') as file:
             offworld_data = file.read()
             tr[palette_offset:palette_offset + 8] = offworld_data[0:8]
             tr[data_offset:data_offset + 256] = offworld_data[8:264]
@@ -151,6 +176,9 @@ class _DestinationType(IntEnum):
     LinkWithMe = 2
 
 
+_item_table_entry_struct = struct.Struct("<HHHH")
+
+
 @dataclass
 class _ItemTableEntry:
     destination: _DestinationType
@@ -159,17 +187,118 @@ class _ItemTableEntry:
     advancement: bool
 
     def to_bytes(self) -> bytes:
-        return (self.destination.to_bytes(2, "little") +
-                self.item_id.to_bytes(2, "little") +
-                self.player_index.to_bytes(2, "little") +
-                self.advancement.to_bytes(2, "little"))
+        return _item_table_entry_struct.pack(self.destination, self.item_id, self.player_index, self.advancement)
+
+    def pack_into(self, buffer: bytearray, offset: int) -> None:
+        _item_table_entry_struct.pack_into(buffer, offset,
+                                           self.destination, self.item_id, self.player_index, self.advancement)
+
+
+ITEM_TABLE_ENTRY_SIZE = _item_table_entry_struct.size
+
+
+def pack_item_table(item_table: Mapping[int, _ItemTableEntry]) -> bytearray:
+    """ one buffer, indexed by location index (unused indexes are 0) """
+    tr = bytearray(ITEM_TABLE_ENTRY_SIZE * (max(item_table, default=-1) + 1))
+    for loc_id, entry in item_table.items():
+        entry.pack_into(tr, loc_id * ITEM_TABLE_ENTRY_SIZE)
+    return tr
 
 
 NUM_ITEMS_WITH_ICONS = len(local_id_to_cliff_item)
 
-ItemNames_ItemTable_PlayerNames_PlayerIDs = Tuple[List[bytearray], Dict[int, _ItemTableEntry], bytearray, List[int]]
+ItemNames_ItemTable_PlayerNames_PlayerIDs = Tuple[bytearray, Dict[int, _ItemTableEntry], bytearray, List[int]]
+""" item names are `ITEM_NAME_ROM_SIZE` bytes each, concatenated """
 
 ItemNames_ItemTable_PlayerNames_PlayerIDs_JSON = Tuple[List[List[int]], Dict[str, List[int]], List[int], List[int]]
+""" gen data before version 3 """
+
+PackedItemRomData = Dict[str, str]
+""" each table as one base64 blob - "item_names", "item_table", "player_names", "player_ids" """
+
+
+@dataclass
+class ItemRomTables:
+    """ the item tables exactly as they go in the rom """
+    item_names: bytes
+    """ names of items from other games (after the constant names of items with icons) """
+    item_table: bytes
+    """ indexed by location index """
+    player_names: bytes
+    player_ids: bytes
+
+    def records(self) -> List[Tuple[int, bytes]]:
+        """ (rom offset, data) for each table """
+        return [
+            (offset_from_symbol("message_item_names") + ITEM_NAME_ROM_SIZE * NUM_ITEMS_WITH_ICONS, self.item_names),
+            (offset_from_symbol("rando_item_table"), self.item_table),
+            (offset_from_symbol("rando_player_name_table"), self.player_names),
+            (offset_from_symbol("rando_player_id_table"), self.player_ids),
+        ]
+
+    def write(self, rom_writer: RomWriter) -> None:
+        """ one `writeBytes` for each table """
+        for offset, data in self.records():
+            rom_writer.writeBytes(offset, data)
+
+    def to_packed(self) -> PackedItemRomData:
+        return {
+            "item_names": base64.b64encode(self.item_names).decode(),
+            "item_table": base64.b64encode(self.item_table).decode(),
+            "player_names": base64.b64encode(self.player_names).decode(),
+            "player_ids": base64.b64encode(self.player_ids).decode(),
+        }
+
+    @staticmethod
+    def from_packed(packed: PackedItemRomData) -> "ItemRomTables":
+        return ItemRomTables(
+            base64.b64decode(packed["item_names"]),
+            base64.b64decode(packed["item_table"]),
+            base64.b64decode(packed["player_names"]),
+            base64.b64decode(packed["player_ids"]),
+        )
+
+    @staticmethod
+    def from_json(json_result: ItemNames_ItemTable_PlayerNames_PlayerIDs_JSON) -> "ItemRomTables":
+        """ from the older format """
+        item_names_after_constants, item_table, player_names, sorted_player_ids = json_result
+        packed_table = bytearray(ITEM_TABLE_ENTRY_SIZE * (max(map(int, item_table), default=-1) + 1))
+        for index, entry in item_table.items():
+            offset = int(index) * ITEM_TABLE_ENTRY_SIZE
+            packed_table[offset:offset + ITEM_TABLE_ENTRY_SIZE] = bytes(entry)
+        return ItemRomTables(
+            bytes(chain.from_iterable(item_names_after_constants)),
+            bytes(packed_table),
+            bytes(player_names),
+            _pack_player_ids(sorted_player_ids),
+        )
+
+    @staticmethod
+    def from_gen_data(item_rom_data: Union[PackedItemRomData, ItemNames_ItemTable_PlayerNames_PlayerIDs_JSON]
+                      ) -> "ItemRomTables":
+        if isinstance(item_rom_data, dict):
+            return ItemRomTables.from_packed(item_rom_data)
+        return ItemRomTables.from_json(item_rom_data)
+
+
+def _pack_player_ids(sorted_player_ids: List[int]) -> bytes:
+    return struct.pack(f"<{len(sorted_player_ids)}H", *sorted_player_ids)
+
+
+class LocationIndex:
+    """ multiworld locations bucketed once, to be shared by every Cliffhanger Redux slot """
+    by_player: Dict[int, List[Location]]
+    """ locations in each player's world """
+    by_item_player: Dict[int, List[Location]]
+    """ locations holding each player's items (in any world) """
+
+    def __init__(self, locations: Iterable[Location]) -> None:
+        self.by_player = defaultdict(list)
+        self.by_item_player = defaultdict(list)
+        for loc in locations:
+            self.by_player[loc.player].append(loc)
+            if loc.item:
+                self.by_item_player[loc.item.player].append(loc)
 
 
 class ItemRomData:
@@ -202,11 +331,20 @@ class ItemRomData:
                 # my item in someone else's location
                 self.player_ids.add(loc.player)
 
+    def register_index(self, index: LocationIndex) -> None:
+        """ same as calling `register` with every multiworld location, but only looks at the ones that matter """
+        for loc in index.by_player.get(self.player, ()):
+            self.register(loc)
+        for loc in index.by_item_player.get(self.player, ()):
+            if loc.player != self.player:
+                self.register(loc)
+
     def _make_tables(self) -> ItemNames_ItemTable_PlayerNames_PlayerIDs:
         """ after all locations are registered """
         item_table: Dict[int, _ItemTableEntry] = {}
 
-        item_names_after_constants: List[bytearray] = []
+        foreign_item_ids: Dict[str, int] = {}
+        """ rom text of item name -> item id - identical names share 1 slot in the rom """
         sorted_player_ids = sorted(self.player_ids)
         if len(sorted_player_ids) > 202:  # magic number from asm patch TODO change to 142
             # this should never happen
@@ -237,15 +375,15 @@ class ItemRomData:
                 )
             else:  # someone else's item in my location
                 # TODO: check for item links that include me
-                item_id = NUM_ITEMS_WITH_ICONS + len(item_names_after_constants)
                 # items we can display from other games
                 if isinstance(loc.item, CliffReduxItem):
                     # someone else's super junkoid item in my location
                     assert loc.item.code
                     item_id = loc.item.code - base_id
-                if item_id == NUM_ITEMS_WITH_ICONS + len(item_names_after_constants):
+                else:
                     # if we didn't find a super junkoid sprite for this item
-                    item_names_after_constants.append(make_item_name_for_rom(loc.item.name))
+                    name_text = _item_name_text(loc.item.name)
+                    item_id = foreign_item_ids.setdefault(name_text, NUM_ITEMS_WITH_ICONS + len(foreign_item_ids))
 
                 table_entry = _ItemTableEntry(
                     _DestinationType.Other,
@@ -256,52 +394,34 @@ class ItemRomData:
             for loc_id in cr_loc_ids:
                 item_table[loc_id] = table_entry
 
-        player_names = bytearray()
-        player_names.extend(b"  Archipelago   ")
-        for player_id in sorted_player_ids[1:]:
+        item_names_after_constants = bytearray(ITEM_NAME_ROM_SIZE * len(foreign_item_ids))
+        for name_text, item_id in foreign_item_ids.items():
+            _write_item_name_text(item_names_after_constants,
+                                  (item_id - NUM_ITEMS_WITH_ICONS) * ITEM_NAME_ROM_SIZE,
+                                  name_text)
+
+        player_names = bytearray(16 * len(sorted_player_ids))
+        player_names[0:16] = b"  Archipelago   "
+        for i, player_id in enumerate(sorted_player_ids[1:], 1):
             this_name = self.player_id_to_name[player_id].upper().encode("ascii", "ignore")[:16].center(16)
-            player_names.extend(this_name)
+            player_names[i * 16:(i + 1) * 16] = this_name
 
         return item_names_after_constants, item_table, player_names, sorted_player_ids
 
-    def get_jsonable_data(self) -> ItemNames_ItemTable_PlayerNames_PlayerIDs_JSON:
-        """ data that can be encoded to json, and can be passed to `patch_from_json` """
+    def get_tables(self) -> ItemRomTables:
+        """ after all locations are registered """
         item_names_after_constants, item_table, player_names, sorted_player_ids = self._make_tables()
-
-        return (
-            [list(item_name) for item_name in item_names_after_constants],
-            {str(loc_id): list(entry.to_bytes()) for loc_id, entry in item_table.items()},
-            list(player_names),
-            sorted_player_ids
+        assert len(item_table) == max(item_table, default=-1) + 1, "item table should cover every location index"
+        return ItemRomTables(
+            bytes(item_names_after_constants),
+            bytes(pack_item_table(item_table)),
+            bytes(player_names),
+            _pack_player_ids(sorted_player_ids),
         )
 
-    @staticmethod
-    def patch_from_json(
-        rom: Union[bytes, bytearray],
-        json_result: ItemNames_ItemTable_PlayerNames_PlayerIDs_JSON
-    ) -> bytearray:
-        tr = bytearray(rom)
-        item_names_after_constants, item_table, player_names, sorted_player_ids = json_result
-
-        item_names_offset = offset_from_symbol("message_item_names") + 64 * NUM_ITEMS_WITH_ICONS
-        concat_bytes = bytes(chain.from_iterable(item_names_after_constants))
-        tr[item_names_offset:item_names_offset + len(concat_bytes)] = concat_bytes
-
-        item_table_offset = offset_from_symbol("rando_item_table")
-        for index, entry in item_table.items():
-            data = bytes(entry)
-            this_offset = item_table_offset + int(index) * len(data)
-            tr[this_offset:this_offset + len(data)] = data
-
-        player_name_offset = offset_from_symbol("rando_player_name_table")
-        tr[player_name_offset:player_name_offset + len(player_names)] = player_names
-
-        player_id_offset = offset_from_symbol("rando_player_id_table")
-        for i, id_ in enumerate(sorted_player_ids):
-            this_offset = player_id_offset + i * 2
-            tr[this_offset:this_offset + 2] = id_.to_bytes(2, "little")
-
-        return tr
+    def get_packed_data(self) -> PackedItemRomData:
+        """ data that can be encoded to json, and can be passed to `ItemRomTables.from_packed` """
+        return self.get_tables().to_packed()
 
 
 def ips_patch_from_file(ips_file_name: Union[str, Path], input_bytes: Union[bytes, bytearray]) -> bytearray:
@@ -316,29 +436,40 @@ def get_multi_patch_path() -> Path:
 
 @dataclass
 class GenData:
-    item_rom_data: ItemNames_ItemTable_PlayerNames_PlayerIDs_JSON
-    cr_game: CrGame
+    item_rom_data: Union[PackedItemRomData, ItemNames_ItemTable_PlayerNames_PlayerIDs_JSON]
+    """ includes the item id for each location index (json lists before version 3) """
     player: int
     game_name_in_rom: Union[bytes, bytearray]
 
 
+GEN_DATA_VERSION = 3
+"""
+1 (no version field): also had the whole `Game` (every location dict) in "cr_game"
+2: only what patching needs - everything about locations comes from the bundled location table
+3: item rom data as packed tables (`PackedItemRomData`)
+"""
+
+
 def make_gen_data(data: GenData) -> str:
     """ serialized data from generation needed to patch rom """
     jsonable = {
+        "version": GEN_DATA_VERSION,
         "item_rom_data": data.item_rom_data,
-        "cr_game": data.cr_game.to_jsonable(),
         "player": data.player,
-        "game_name_in_rom": list(data.game_name_in_rom)
+        "game_name_in_rom": bytes(data.game_name_in_rom).hex()
     }
-    return json.dumps(jsonable)
+    return json.dumps(jsonable, separators=(",", ":"))
 
 
 def get_gen_data(gen_data_str: str) -> GenData:
-    """ the reverse of `make_gen_data` """
+    """ the reverse of `make_gen_data` (also reads version 1) """
     from_json = json.loads(gen_data_str)
+    version = from_json.get("version", 1)
+    if version > GEN_DATA_VERSION:
+        raise ValueError(f"patch data version {version} is newer than this Cliffhanger Redux apworld")
+    game_name_in_rom = from_json["game_name_in_rom"]
     return GenData(
         from_json["item_rom_data"],
-        CrGame.from_jsonable(from_json["cr_game"]),
         from_json["player"],
-        bytes(from_json["game_name_in_rom"])
+        bytes.fromhex(game_name_in_rom) if version >= 2 else bytes(game_name_in_rom)
     )
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+tables that `make_apworld.py` builds ahead of time, so the apworld doesn't parse csv and json when it's loaded
+
+The file starts with the magic number of the Python that built it,
+because `marshal` data is only good for the same version of Python.
+When it doesn't match, or there is no file (running from source),
+`load` returns `None` and the callers read the original files.
+
+(no imports from the rest of the world at module level except `lazy`, so `make_apworld.py` can load this
+without Archipelago)
+"""
+import marshal
+from importlib.util import MAGIC_NUMBER
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .lazy import Lazy
+
+FILE_NAME = "prebuilt_tables.bin"
+
+
+def build(tables: Dict[str, Any]) -> bytes:
+    """ contents of the file - each table marshalled separately, so loading one doesn't load the others """
+    return MAGIC_NUMBER + marshal.dumps({name: marshal.dumps(table) for name, table in tables.items()})
+
+
+def _read_tables() -> Dict[str, bytes]:
+    from .config import open_file_apworld_compatible
+
+    path = Path(__file__).parent.resolve().joinpath(FILE_NAME)
+    try:
+        with open_file_apworld_compatible(path, "rb") as file:
+            data = file.read()
+    except (OSError, KeyError):  # KeyError - not in the apworld zip
+        return {}
+    if data[:len(MAGIC_NUMBER)] != MAGIC_NUMBER:
+        return {}
+    return marshal.loads(data[len(MAGIC_NUMBER):])
+
+
+_tables: Lazy[Dict[str, bytes]] = Lazy("prebuilt tables", _read_tables)
+""" {table name: marshal data} - `{}` if there aren't any usable tables """
+
+
+def load(name: str) -> Optional[Any]:
+    """ a new copy of the prebuilt table each call, or `None` if it's not available """
+    table_data = _tables.get().get(name)
+    if table_data is None:
+        return None
+    return marshal.loads(table_data)
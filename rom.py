@@ -1,18 +1,32 @@
 import hashlib
+import json
+import logging
+import mmap
 import os
 import zipfile
-from typing import Any, Optional
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
-from .cliff_redux_randomizer.romWriter import RomWriter
+from .cliff_redux_randomizer import instrumentation
+from .cliff_redux_randomizer.ips import patch as ips_patch, records as ips_records
+from .cliff_redux_randomizer.romWriter import RomWriter, SNES_HEADER_CHECKSUM_COMPLEMENT
 
 import Utils
 from Utils import read_snes_rom
 from worlds.Files import APDeltaPatch, APContainer
-from worlds.cliffredux.patch_utils import get_gen_data, ips_patch_from_file, get_multi_patch_path, patch_item_sprites, \
-    ItemRomData, offset_from_symbol
+from worlds.cliffredux.location import location_data
+from worlds.cliffredux.config import open_file_apworld_compatible
+from worlds.cliffredux.lazy import Lazy
+from worlds.cliffredux.patch_utils import GenData, get_gen_data, ips_patch_from_file, get_multi_patch_path, \
+    patch_item_sprites, ItemRomTables, offset_from_symbol, get_item_sprite_paths, get_symbols_path
+from worlds.cliffredux.rom_cache import RomCache, make_key, temp_file_path
 
 SMJUHASH = '21f3e98df4780ee1c667b84e57d88675'
 
+ROM_CACHE_VERSION = 3
+""" change this when patching code changes what it writes, so cached roms aren't used """
+
 AP_ITEM = ("AP Item",
            b"\x70\xf8",
            b"\x74\xf8",
@@ -20,6 +34,41 @@ AP_ITEM = ("AP Item",
            b"\x00")
 
 
+_hiddenness_plm = {
+    "open": AP_ITEM[1],
+    "chozo": AP_ITEM[2],
+    "hidden": AP_ITEM[3],
+}
+
+
+def _make_item_plm_table() -> List[Tuple[int, bytes]]:
+    table: List[Tuple[int, bytes]] = []
+    for loc in location_data.values():
+        plmid = _hiddenness_plm.get(loc["hiddenness"], AP_ITEM[1])
+        table.append((loc["locationid"], plmid))
+        if loc["altlocationids"][0] != 0:
+            for address in loc["altlocationids"]:
+                table.append((address, plmid))
+    table.sort()
+    return table
+
+
+_item_plm_table: Lazy[List[Tuple[int, bytes]]] = Lazy("item plm table", _make_item_plm_table)
+
+
+def item_plm_table() -> List[Tuple[int, bytes]]:
+    """ (rom offset, AP item PLM id) for every item PLM, including alternate locations - sorted by offset """
+    return _item_plm_table.get()
+
+
+def write_item_plms(rom_data: Union[bytearray, memoryview, mmap.mmap]) -> None:
+    """ every item location becomes an AP item (same as `RomWriter.writeItem` for each) """
+    ammo = AP_ITEM[4][0]
+    for offset, plmid in item_plm_table():
+        rom_data[offset:offset + 2] = plmid
+        rom_data[offset + 5] = ammo
+
+
 # SNIClient assumes that the patch it gets is an APDeltaPatch
 # Otherwise, it might be better to inherit from APContainer instead of APDeltaPatch.
 # So in some places, instead of calling `super()`, we jump over APDeltaPatch to APContainer
@@ -32,10 +81,21 @@ class CliffReduxDeltaPatch(APDeltaPatch):
 
     gen_data: str
     """ JSON encoded """
-
-    def __init__(self, *args: Any, patched_path: str = "", gen_data: str = "", **kwargs: Any) -> None:
+    seed_ips: bytes
+    """ `make_seed_ips` - empty in containers from before it was added """
+    seed_ips_base: str
+    """ `get_base_patch_digest` of the base patched rom that `seed_ips` applies to """
+
+    def __init__(self,
+                 *args: Any,
+                 patched_path: str = "",
+                 gen_data: str = "",
+                 seed_ips: bytes = b"",
+                 **kwargs: Any) -> None:
         super().__init__(*args, patched_path=patched_path, **kwargs)
         self.gen_data = gen_data
+        self.seed_ips = seed_ips
+        self.seed_ips_base = get_base_patch_digest() if seed_ips else ""
 
     @classmethod
     def get_source_data(cls) -> bytes:
@@ -46,29 +106,177 @@ class CliffReduxDeltaPatch(APDeltaPatch):
         opened_zipfile.writestr("rom_data.json",
                                 self.gen_data,
                                 compress_type=zipfile.ZIP_DEFLATED)
+        if self.seed_ips:
+            opened_zipfile.writestr("seed.ips",
+                                    self.seed_ips,
+                                    compress_type=zipfile.ZIP_DEFLATED)
+            opened_zipfile.writestr("seed_ips_base.txt", self.seed_ips_base)
 
     def read_contents(self, opened_zipfile: zipfile.ZipFile):
         APContainer.read_contents(self, opened_zipfile)
         self.gen_data = opened_zipfile.read("rom_data.json").decode()
+        names = set(opened_zipfile.namelist())
+        if "seed.ips" in names and "seed_ips_base.txt" in names:
+            self.seed_ips = opened_zipfile.read("seed.ips")
+            self.seed_ips_base = opened_zipfile.read("seed_ips_base.txt").decode()
+        else:
+            self.seed_ips = b""
+            self.seed_ips_base = ""
+
+    def usable_seed_ips(self, base_patch_digest: Optional[str] = None) -> Optional[bytes]:
+        """
+        `seed_ips` if it was made for this base patched rom (`get_base_patch_digest` if not given), else `None`
+
+        (the seed ips is only good for the same base patched rom it was made for)
+        """
+        if base_patch_digest is None:
+            base_patch_digest = get_base_patch_digest()
+        if self.seed_ips and self.seed_ips_base == base_patch_digest:
+            return self.seed_ips
+        return None
 
     def patch(self, target: str) -> None:
         self.read()
-        write_rom_from_gen_data(self.gen_data, target)
+        write_rom_from_gen_data(self.gen_data, target, self.usable_seed_ips())
+
+
+VANILLA = "vanilla"
+HEADERED = "headered"
+""" vanilla with a copier header """
+CLIFF_REDUX = "cliffhanger redux"
+""" already patched """
+
+VANILLA_ROM_SIZE = 3145728
+CLIFF_REDUX_ROM_SIZE = 3178496
+
+BASE_ROM_IDS_VERSION = 2
+""" change this when `identify_base_rom` checks change, so saved identifications are checked again """
+
+
+@dataclass(frozen=True)
+class BaseRomId:
+    md5: str
+    """ without a copier header """
+    variant: str
+    """ `VANILLA`, `HEADERED`, or `CLIFF_REDUX` """
+
+
+def _cliff_redux_patch_path() -> Path:
+    return Path(__file__).parent.resolve().joinpath("cliff_redux_randomizer", "SMCR_uh.IPS")
+
+
+def is_cliff_redux_rom(rom_bytes: bytes) -> bool:
+    """
+    whether this is vanilla SM with this version of the Cliffhanger Redux patch
+
+    Applying the patch again to a rom that it made doesn't change anything.
+    (The vanilla bytes that the patch doesn't touch can't be checked without the vanilla rom.)
+    """
+    with open_file_apworld_compatible(_cliff_redux_patch_path(), "rb") as patch_file:
+        cr_patch = patch_file.read()
+    return len(rom_bytes) == CLIFF_REDUX_ROM_SIZE and ips_patch(rom_bytes, cr_patch) == rom_bytes
+
+
+def identify_base_rom(rom_bytes: bytes, headered: bool) -> BaseRomId:
+    """ `rom_bytes` without the header - raises if it's not a rom we can patch """
+    md5 = hashlib.md5(rom_bytes).hexdigest()
+    if len(rom_bytes) == CLIFF_REDUX_ROM_SIZE:
+        if not is_cliff_redux_rom(rom_bytes):
+            raise Exception('Supplied Base Rom is not vanilla Super Metroid or this version of Cliffhanger Redux. '
+                            'Get the correct game and version, then dump it')
+        base_rom_id = BaseRomId(md5, CLIFF_REDUX)
+    elif len(rom_bytes) == VANILLA_ROM_SIZE:
+        base_rom_id = BaseRomId(md5, HEADERED if headered else VANILLA)
+    else:
+        raise ValueError(f"invalid rom {len(rom_bytes)} - need vanilla SM")
+    check_base_rom_id(base_rom_id)
+    return base_rom_id
+
+
+def check_base_rom_id(base_rom_id: BaseRomId) -> None:
+    """ a Cliffhanger Redux rom is checked against the patch when it's identified (`identify_base_rom`) """
+    if base_rom_id.variant != CLIFF_REDUX and base_rom_id.md5 != SMJUHASH:
+        raise Exception('Supplied Base Rom does not match known MD5 for Japan+US release. '
+                        'Get the correct game and version, then dump it')
+
+
+def _base_rom_ids_path() -> str:
+    return Utils.cache_path("cliffredux", "base_rom_ids.json")
+
+
+def _read_base_rom_ids() -> Dict[str, Dict[str, Any]]:
+    """ {absolute path: {"version", "size", "mtime_ns", "md5", "variant"}} """
+    try:
+        with open(_base_rom_ids_path()) as file:
+            base_rom_ids = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return base_rom_ids if isinstance(base_rom_ids, dict) else {}
+
+
+def _save_base_rom_id(path: str, stat: os.stat_result, base_rom_id: BaseRomId) -> None:
+    base_rom_ids = _read_base_rom_ids()
+    base_rom_ids[path] = {
+        "version": BASE_ROM_IDS_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "md5": base_rom_id.md5,
+        "variant": base_rom_id.variant,
+    }
+    ids_path = _base_rom_ids_path()
+    temp_path = temp_file_path(ids_path)
+    try:
+        os.makedirs(os.path.dirname(ids_path), exist_ok=True)
+        with open(temp_path, "w") as file:
+            json.dump(base_rom_ids, file)
+        os.replace(temp_path, ids_path)
+    except OSError as e:
+        logging.warning(f"couldn't save base rom identification: {e}")
+
+
+def _read_base_rom(file_name: str) -> Tuple[bytes, BaseRomId]:
+    file_name = os.path.abspath(get_base_rom_path(file_name))
+    with open(file_name, "rb") as file:
+        stat = os.fstat(file.fileno())
+        base_rom_bytes = bytes(read_snes_rom(file))
+
+    base_rom_id = identify_base_rom(base_rom_bytes, stat.st_size != len(base_rom_bytes))
+    _save_base_rom_id(file_name, stat, base_rom_id)
+    return base_rom_bytes, base_rom_id
+
+
+_base_rom: Lazy[Tuple[bytes, BaseRomId]] = Lazy("base rom")
 
 
 def get_base_rom_bytes(file_name: str = "") -> bytes:
-    base_rom_bytes: Optional[bytes] = getattr(get_base_rom_bytes, "base_rom_bytes", None)
-    if not base_rom_bytes:
-        file_name = get_base_rom_path(file_name)
-        base_rom_bytes = bytes(read_snes_rom(open(file_name, "rb")))
+    """ also identifies the rom (`get_base_rom_id`) from this one read of the file """
+    return _base_rom.get(lambda: _read_base_rom(file_name))[0]
+
+
+def _find_base_rom_id(file_name: str) -> BaseRomId:
+    if _base_rom.ready:
+        return _base_rom.get()[1]
+    path = os.path.abspath(get_base_rom_path(file_name))
+    stat = os.stat(path)
+    entry = _read_base_rom_ids().get(path)
+    if (
+            entry and
+            entry.get("version") == BASE_ROM_IDS_VERSION and
+            entry.get("size") == stat.st_size and
+            entry.get("mtime_ns") == stat.st_mtime_ns
+    ):
+        base_rom_id = BaseRomId(entry["md5"], entry["variant"])
+        check_base_rom_id(base_rom_id)
+        return base_rom_id
+    return _base_rom.get(lambda: _read_base_rom(file_name))[1]
+
 
-        basemd5 = hashlib.md5()
-        basemd5.update(base_rom_bytes)
-        """if SMJUHASH != basemd5.hexdigest():
-            raise Exception('Supplied Base Rom does not match known MD5 for Japan+US release. '
-                            'Get the correct game and version, then dump it')"""
-        setattr(get_base_rom_bytes, "base_rom_bytes", base_rom_bytes)
-    return base_rom_bytes
+_base_rom_id: Lazy[BaseRomId] = Lazy("base rom id")
+
+
+def get_base_rom_id(file_name: str = "") -> BaseRomId:
+    """ from the sidecar cache if the file's size and mtime haven't changed - otherwise reads the file """
+    return _base_rom_id.get(lambda: _find_base_rom_id(file_name))
 
 
 def get_base_rom_path(file_name: str = "") -> str:
@@ -80,36 +288,166 @@ def get_base_rom_path(file_name: str = "") -> str:
     return file_name
 
 
-def write_rom_from_gen_data(gen_data_str: str, output_rom_file_name: str) -> None:
-    """ take the output of `make_gen_data`, and create rom from it """
-    gen_data = get_gen_data(gen_data_str)
-
-    base_rom_path = get_base_rom_path()
-    rom_writer = RomWriter.fromFilePath(base_rom_path)  # this patches SM to Cliffhanger Redux
+def _make_base_patched_rom_bytes() -> bytes:
+    rom_writer = RomWriter.fromRomData(get_base_rom_bytes())
+    rom_writer.patch_if_vanilla()  # this patches SM to Cliffhanger Redux
 
     multi_patch_path = get_multi_patch_path()
     rom_writer.rom_data = ips_patch_from_file(multi_patch_path, rom_writer.rom_data)
 
     rom_writer.rom_data = patch_item_sprites(rom_writer.rom_data)
 
-    rom_writer.rom_data = ItemRomData.patch_from_json(rom_writer.rom_data, gen_data.item_rom_data)
-
     # change values for chozo ball hearts and lucky frog to match the open variant
-    #rom_writer.writeBytes(0x026474, b"\x19")
-    #rom_writer.writeBytes(0x026909, b"\x32")
-
-    for loc in gen_data.cr_game.all_locations.values():
-        if loc["hiddenness"] == "hidden":
-            plmid = AP_ITEM[3]
-        elif loc["hiddenness"] == "chozo":
-            plmid = AP_ITEM[2]
+    # rom_writer.writeBytes(0x026474, b"\x19")
+    # rom_writer.writeBytes(0x026909, b"\x32")
+
+    write_item_plms(rom_writer.rom_data)
+
+    return bytes(rom_writer.rom_data)
+
+
+_base_patched_rom_bytes: Lazy[bytes] = Lazy("base patched rom", _make_base_patched_rom_bytes)
+
+
+def get_base_patched_rom_bytes() -> bytes:
+    """ everything that's the same for every seed: Cliffhanger Redux, the multiworld patch, AP item sprites and PLMs """
+    return _base_patched_rom_bytes.get()
+
+
+def _make_base_patched_rom_sum() -> int:
+    sum_path = f"{get_base_patched_rom_path()}.json"
+    try:
+        with open(sum_path) as file:
+            return int(json.load(file)["rom_sum"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    rom_writer = RomWriter.fromRomData(get_base_patched_rom_bytes())
+    rom_writer.trackChecksum()
+    base_patched_rom_sum = rom_writer.romSum
+    assert base_patched_rom_sum is not None
+    _write_cache_file(sum_path, json.dumps({"rom_sum": base_patched_rom_sum}).encode())
+    return base_patched_rom_sum
+
+
+_base_patched_rom_sum: Lazy[int] = Lazy("base patched rom sum", _make_base_patched_rom_sum)
+
+
+def get_base_patched_rom_sum() -> int:
+    """ `RomWriter.romSum` of `get_base_patched_rom_bytes` (saved next to `get_base_patched_rom_path`) """
+    return _base_patched_rom_sum.get()
+
+
+def _write_cache_file(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = temp_file_path(path)
+    with open(temp_path, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+def _make_base_patched_rom_path() -> str:
+    name = hashlib.sha256(f"{get_base_rom_digest()}:{get_base_patch_digest()}".encode()).hexdigest()[:32]
+    return Utils.cache_path("cliffredux", f"base_patched_{name}.sfc")
+
+
+_base_patched_rom_path: Lazy[str] = Lazy("base patched rom path", _make_base_patched_rom_path)
+
+
+def get_base_patched_rom_path() -> str:
+    """
+    `get_base_patched_rom_bytes` saved in the cache directory, to copy for each output rom
+
+    named by the base rom and base patches, so when it's already there, the base rom doesn't need to be read
+    """
+    path = _base_patched_rom_path.get()
+    if not os.path.exists(path):
+        # (more than one thread might write it, but each replaces the whole file with the same data)
+        _write_cache_file(path, get_base_patched_rom_bytes())
+    return path
+
+
+def get_base_rom_digest() -> str:
+    return get_base_rom_id().md5
+
+
+def _make_base_patch_digest() -> str:
+    h = hashlib.sha256(ROM_CACHE_VERSION.to_bytes(4, "little"))
+    data_paths = (
+        _cliff_redux_patch_path(),
+        get_multi_patch_path(),
+        get_symbols_path(),  # where the sprites go
+        *get_item_sprite_paths(),
+    )
+    for data_path in data_paths:
+        with open_file_apworld_compatible(data_path, "rb") as data_file:
+            data = data_file.read()
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    # from the location table
+    for offset, plm_id in item_plm_table():
+        h.update(offset.to_bytes(4, "little"))
+        h.update(plm_id)
+    return h.hexdigest()
+
+
+_base_patch_digest: Lazy[str] = Lazy("base patch digest", _make_base_patch_digest)
+
+
+def get_base_patch_digest() -> str:
+    """
+    everything that makes the base patched rom (other than the base rom), and the version of the code that applies it
+
+    the patches, the item sprites and where they go, and the item PLMs from the location table
+    """
+    return _base_patch_digest.get()
+
+
+def get_rom_cache() -> RomCache:
+    return RomCache(Utils.cache_path("cliffredux", "roms"))
+
+
+def write_rom_from_gen_data(gen_data_str: str,
+                            output_rom_file_name: str,
+                            seed_ips: Optional[bytes] = None,
+                            use_cache: bool = True) -> None:
+    """
+    take the output of `make_gen_data`, and create rom from it (or copy it from the rom cache)
+
+    `seed_ips` (from `make_seed_ips`) replaces decoding and writing the gen data
+    """
+    rom_cache = get_rom_cache() if use_cache else None
+    cache_key = make_key(gen_data_str, get_base_rom_digest(), get_base_patch_digest())
+    if rom_cache and rom_cache.get(cache_key, output_rom_file_name):
+        logging.info(f"Cliffhanger Redux rom from cache {cache_key}")
+        return
+
+    # the output file starts as a copy of the base patched rom, and only the seed's bytes are written to it
+    # (removed if anything goes wrong, so a partly written rom isn't left there)
+    with RomWriter.fromMappedCopy(get_base_patched_rom_path(), output_rom_file_name) as rom_writer:
+        rom_writer.trackChecksum(get_base_patched_rom_sum())
+
+        if seed_ips:
+            rom_writer.applyIps(seed_ips)
         else:
-            plmid = AP_ITEM[1]
+            write_seed_data(rom_writer, get_gen_data(gen_data_str))
 
-        rom_writer.writeItem(loc["locationid"], plmid, AP_ITEM[4])
-        if loc["altlocationids"][0] != 0:
-            for address in loc["altlocationids"]:
-                rom_writer.writeItem(address, plmid, AP_ITEM[4])
+        rom_writer.finalizeRom()  # checksum, flushes rom file
+    logging.info(f"Cliffhanger Redux rom {output_rom_file_name} md5 {rom_writer.md5} crc32 {rom_writer.crc32:08x}")
+
+    if rom_cache:
+        rom_cache.put(cache_key, output_rom_file_name)
+
+    if instrumentation.enabled:
+        logging.info(f"Cliffhanger Redux instrumentation after patching:\n{instrumentation.report()}")
+
+
+def write_seed_data(rom_writer: RomWriter, gen_data: GenData) -> None:
+    """
+    everything in the rom that's different for each seed
+
+    only `writeBytes`, so it works with any type of `RomWriter` (an ips writer gives a patch for the base patched rom)
+    """
+    ItemRomTables.from_gen_data(gen_data.item_rom_data).write(rom_writer)
 
     # TODO: deathlink
     # self.multiworld.death_link[self.player].value
@@ -125,4 +463,55 @@ def write_rom_from_gen_data(gen_data_str: str, output_rom_file_name: str) -> Non
 
     rom_writer.writeBytes(0x7fc0, gen_data.game_name_in_rom)
 
-    rom_writer.finalizeRom(output_rom_file_name)  # writes rom file
+
+def make_seed_ips(gen_data: GenData) -> bytes:
+    """
+    `write_seed_data` as an IPS patch to the base patched rom
+
+    It doesn't include the SNES checksum, which depends on the base rom - `RomWriter.trackChecksum` to fix that.
+    """
+    rom_writer = RomWriter.fromBlankIps()
+    write_seed_data(rom_writer, gen_data)
+    rom_writer.finalizeRom()
+    return bytes(rom_writer.getFinalIps())
+
+
+HOT_PATCH_MAX_GAP = 64
+""" bytes - ranges closer than this are written as one (a write costs more than a few more bytes) """
+
+
+def coalesce_ranges(ranges: Iterable[Tuple[int, int]], max_gap: int = 0) -> List[Tuple[int, int]]:
+    """ (begin, end) ranges sorted and merged where they overlap or are no more than `max_gap` apart """
+    tr: List[Tuple[int, int]] = []
+    for begin, end in sorted(ranges):
+        if tr and begin <= tr[-1][1] + max_gap:
+            tr[-1] = (tr[-1][0], max(tr[-1][1], end))
+        else:
+            tr.append((begin, end))
+    return tr
+
+
+def make_hot_patch(gen_data_str: str,
+                   seed_ips: Optional[bytes] = None,
+                   previous_ranges: Iterable[Tuple[int, int]] = ()) -> List[Tuple[int, bytes]]:
+    """
+    (rom offset, data) to write into a running base patched rom to make it this seed's rom
+
+    the seed's writes and the SNES checksum, coalesced into as few ranges as `HOT_PATCH_MAX_GAP` allows
+
+    The seed's tables are different sizes for different seeds, so writing over another seed's rom
+    can leave some of the other seed's bytes after the end of the tables (which this seed doesn't read).
+    `previous_ranges` (ranges written by an earlier hot patch) are included, to put those back the way they were.
+    """
+    if seed_ips is None:
+        seed_ips = make_seed_ips(get_gen_data(gen_data_str))
+    rom_writer = RomWriter.fromRomData(get_base_patched_rom_bytes())
+    rom_writer.trackChecksum(get_base_patched_rom_sum())
+    rom_writer.applyIps(seed_ips)
+    rom_writer.finalizeRom()  # (only the checksum - no file)
+    rom_data = rom_writer.rom_data
+
+    ranges = [(offset, offset + len(data)) for offset, data in ips_records(seed_ips)]
+    ranges.append((SNES_HEADER_CHECKSUM_COMPLEMENT, SNES_HEADER_CHECKSUM_COMPLEMENT + 4))
+    ranges.extend(previous_ranges)
+    return [(begin, bytes(rom_data[begin:end])) for begin, end in coalesce_ranges(ranges, HOT_PATCH_MAX_GAP)]
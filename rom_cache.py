@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import List, Tuple
+
+from .cliff_redux_randomizer.romWriter import RomWriter
+
+logger = logging.getLogger("Cliffhanger Redux")
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+""" about 80 roms """
+
+
+def temp_file_path(path: str) -> str:
+    """ to write and then `os.replace` - different for each thread, so they don't write the same temp file """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def make_key(gen_data_str: str, base_rom_digest: str, base_patch_digest: str) -> str:
+    """ identifies an output rom - everything that goes into making it """
+    h = hashlib.sha256()
+    for part in (base_rom_digest, base_patch_digest, gen_data_str):
+        encoded = part.encode()
+        h.update(len(encoded).to_bytes(8, "little"))
+        h.update(encoded)
+    return h.hexdigest()
+
+
+class RomCache:
+    """
+    finished roms in a directory, named by `make_key`
+
+    least recently used are removed when the total size is more than `max_bytes`
+
+    Roms are copied out of the cache (reflink when the file system can), not hard linked,
+    because output roms are written in place, which would change the cached rom.
+    """
+    directory: str
+    max_bytes: int
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.sfc")
+
+    def get(self, key: str, target: str) -> bool:
+        """ copy the cached rom to `target` - False if it's not cached """
+        path = self._path(key)
+        try:
+            os.utime(path)  # mark as recently used
+            RomWriter.copyFile(path, target)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            # the rom can still be patched without the cache
+            logger.warning(f"couldn't copy rom from cache: {e}")
+            return False
+        return True
+
+    def put(self, key: str, source: str) -> None:
+        """ add the rom file `source` to the cache """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        temp_path = temp_file_path(path)
+        try:
+            RomWriter.copyFile(source, temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            # the rom is already written, so this isn't worth failing for
+            logger.warning(f"couldn't cache rom: {e}")
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """ remove least recently used roms until the cache fits in `max_bytes` """
+        entries: List[Tuple[float, int, str]] = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".sfc"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,129 @@
+from typing import Callable, Dict, Mapping, Optional, Sequence, Tuple
+from weakref import WeakKeyDictionary
+
+from BaseClasses import CollectionState
+
+from .cliff_redux_randomizer import instrumentation
+from .cliff_redux_randomizer.logic_analysis import ALWAYS, DNF
+from .item import name_to_id as item_name_to_id
+from .logic import area_graph, can_win_dnf
+
+_CompiledClause = Tuple[Tuple[int, int], ...]
+""" ((item index, minimum count), ...) """
+
+
+class RuleTable:
+    """
+    requirements compiled to check a tuple of item counts
+
+    immutable and player-independent, so one table is shared by every Cliffhanger Redux slot
+    """
+    keys: Tuple[str, ...]
+    index: Mapping[str, int]
+    """ key -> bit in the result of `evaluate` """
+    item_names: Tuple[str, ...]
+    """ the order of the counts passed to `evaluate` """
+    always: int
+    """ bits of the keys that don't need any items """
+
+    def __init__(self, requirements: Mapping[str, DNF], item_names: Sequence[str]) -> None:
+        self.keys = tuple(requirements)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.item_names = tuple(item_names)
+        item_index = {name: i for i, name in enumerate(self.item_names)}
+        self._compiled: Tuple[Tuple[_CompiledClause, ...], ...] = tuple(
+            tuple(
+                tuple((item_index[item_name], n) for item_name, n in sorted(clause))
+                for clause in sorted(dnf, key=len)
+            )
+            for dnf in requirements.values()
+        )
+        self.always = sum(1 << i for i, dnf in enumerate(requirements.values()) if dnf == ALWAYS)
+
+    @instrumentation.hook("RuleTable.evaluate")
+    def evaluate(self, counts: Sequence[int]) -> int:
+        """ bitset of every key whose requirement is met by these counts """
+        bits = 0
+        for bit, clauses in enumerate(self._compiled):
+            for clause in clauses:
+                for item_i, n in clause:
+                    if counts[item_i] < n:
+                        break
+                else:
+                    bits |= 1 << bit
+                    break
+        return bits
+
+
+class PlayerRules:
+    """
+    the rules of one player's world
+
+    Every rule is a view onto one bitset per `CollectionState`,
+    which is evaluated once and reused until the world's `collect` or `remove` invalidates it.
+    """
+    player: int
+    table: RuleTable
+
+    def __init__(self, table: RuleTable, player: int) -> None:
+        self.table = table
+        self.player = player
+        self._cache: "WeakKeyDictionary[CollectionState, int]" = WeakKeyDictionary()
+        self._views: Dict[str, Callable[[CollectionState], bool]] = {}
+
+    @instrumentation.hook("PlayerRules.evaluate_all")
+    def evaluate_all(self, state: CollectionState) -> int:
+        """ bitset (`RuleTable.index`) of every rule that `state` satisfies """
+        bits = self._cache.get(state)
+        if bits is None:
+            player = self.player
+            counts = tuple(state.count(item_name, player) for item_name in self.table.item_names)
+            bits = self.table.evaluate(counts)
+            self._cache[state] = bits
+        return bits
+
+    def invalidate(self, state: CollectionState) -> None:
+        """ call when this player's items in `state` change """
+        self._cache.pop(state, None)
+
+    def rule(self, key: str) -> Optional[Callable[[CollectionState], bool]]:
+        """ Archipelago access rule for this key - `None` if it doesn't need any items """
+        mask = 1 << self.table.index[key]
+        if self.table.always & mask:
+            return None
+        view = self._views.get(key)
+        if view is None:
+            evaluate_all = self.evaluate_all
+
+            def view(state: CollectionState) -> bool:
+                if instrumentation.enabled:
+                    instrumentation.count("PlayerRules.rule", key)
+                return bool(evaluate_all(state) & mask)
+
+            self._views[key] = view
+        return view
+
+
+def location_key(loc_name: str) -> str:
+    return f"location {loc_name}"
+
+
+def area_key(area_name: str) -> str:
+    return f"area {area_name}"
+
+
+completion_key = "completion"
+
+
+def make_rule_table() -> RuleTable:
+    """ entrances, locations, and completion - from the analysis of the default logic """
+    requirements: Dict[str, DNF] = {}
+    for area_name, entrance in area_graph.areas.items():
+        requirements[area_key(area_name)] = entrance.requirement
+    for loc_name, placement in area_graph.locations.items():
+        requirements[location_key(loc_name)] = placement.requirement
+    requirements[completion_key] = can_win_dnf
+    return RuleTable(requirements, tuple(item_name_to_id))
+
+
+rule_table = make_rule_table()
@@ -0,0 +1,44 @@
+import random
+import unittest
+from typing import Tuple
+
+from ..cliff_redux_randomizer.romWriter import SNES_HEADER_CHECKSUM_COMPLEMENT, RomWriter
+
+
+def mirror_sum(data: bytes, length: int, mask: int = 0x800000) -> Tuple[int, int]:
+    """ snes9x `checksum_mirror_sum` - (sum, length after mirroring) """
+    while not (length & mask) and mask:
+        mask >>= 1
+    part1 = sum(data[:mask])
+    part2 = 0
+    next_length = length - mask
+    if next_length:
+        part2, next_length = mirror_sum(data[mask:], next_length, mask >> 1)
+        while next_length < mask:
+            next_length += next_length
+            part2 += part2
+        length = mask + mask
+    return (part1 + part2) & 0xffff, length
+
+
+class TestChecksum(unittest.TestCase):
+    def check(self, size: int) -> None:
+        data = random.Random(size).randbytes(size)
+        rom_writer = RomWriter.fromRomData(data)
+        rom_writer.trackChecksum()
+        rom_writer.writeBytes(0x2f0000, b"\x12\x34\x56")
+        if size > 0x300000:
+            rom_writer.writeBytes(size - 2, b"\xff\xff")
+        rom_writer.finalizeRom()
+
+        rom_data = bytes(rom_writer.rom_data)
+        expected, _ = mirror_sum(rom_data, size)
+        offset = SNES_HEADER_CHECKSUM_COMPLEMENT
+        self.assertEqual(int.from_bytes(rom_data[offset + 2:offset + 4], "little"), expected)
+        self.assertEqual(int.from_bytes(rom_data[offset:offset + 2], "little"), expected ^ 0xffff)
+
+    def test_vanilla_size(self) -> None:
+        self.check(3145728)
+
+    def test_cliff_redux_size(self) -> None:
+        self.check(3178496)
@@ -0,0 +1,63 @@
+import random
+import unittest
+from typing import Dict, Iterator, Optional, Tuple
+
+from ..cliff_redux_randomizer import defaultLogic
+from ..cliff_redux_randomizer.generate import new_game
+from ..cliff_redux_randomizer.item import all_items
+from ..cliff_redux_randomizer.loadout import Loadout
+from ..cliff_redux_randomizer.logic_analysis import AreaGraph, LogicAnalysis, satisfies
+from .. import logic_tables
+
+
+class TestLogicAnalysis(unittest.TestCase):
+    """ the analysis of the logic gives the same answers as the logic, for random loadouts """
+    loadout_count = 2000
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.logic_analysis = LogicAnalysis(defaultLogic)
+        cls.tables = logic_tables.build()
+        cls.area_graph = logic_tables.get_area_graph(cls.tables)
+
+    def loadouts(self) -> Iterator[Tuple[Loadout, Dict[str, int]]]:
+        """ (loadout, {item_name: count}) - from nothing to a lot of most items """
+        game = new_game(0)
+        rng = random.Random(1)
+        for _ in range(self.loadout_count):
+            loadout = Loadout(game)
+            chance = rng.random()
+            for item in all_items.values():
+                if rng.random() < chance:
+                    loadout.contents[item] += rng.choice((1, 1, 2, 3, 5, 8, 12, 20))
+            yield loadout, {item[0]: loadout.count(item) for item in all_items.values()}
+
+    def reach(self, area_graph: AreaGraph, area: Optional[str], counts: Dict[str, int]) -> bool:
+        while area is not None:
+            entrance = area_graph.areas[area]
+            if not satisfies(entrance.requirement, counts):
+                return False
+            area = entrance.area
+        return True
+
+    def test_location_dnf(self) -> None:
+        for loadout, counts in self.loadouts():
+            for loc_name, rule in defaultLogic.location_logic.items():
+                self.assertEqual(satisfies(self.logic_analysis.location_dnf[loc_name], counts), rule(loadout),
+                                 f"{loc_name} {counts}")
+
+    def test_area_graph(self) -> None:
+        for loadout, counts in self.loadouts():
+            for loc_name, rule in defaultLogic.location_logic.items():
+                placement = self.area_graph.locations[loc_name]
+                in_graph = (self.reach(self.area_graph, placement.area, counts)
+                            and satisfies(placement.requirement, counts))
+                self.assertEqual(in_graph, rule(loadout), f"{loc_name} {counts}")
+
+    def test_can_win_dnf(self) -> None:
+        wins = 0
+        for loadout, counts in self.loadouts():
+            win = logic_tables.can_win(loadout)
+            wins += win
+            self.assertEqual(satisfies(self.tables["can_win_dnf"], counts), win, f"{counts}")
+        self.assertTrue(wins, "no random loadout could win, so this didn't check much")
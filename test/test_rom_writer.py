@@ -0,0 +1,27 @@
+import os
+import tempfile
+import unittest
+
+from ..cliff_redux_randomizer.romWriter import RomWriter
+
+
+class TestMappedCopy(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output_path = os.path.join(directory.name, "out.sfc")
+        self.base = bytes(range(256)) * 16
+
+    def test_finalized(self) -> None:
+        with RomWriter.fromMappedCopy(self.base, self.output_path) as rom_writer:
+            rom_writer.writeBytes(0, b"\xff")
+            rom_writer.finalizeRom()
+        with open(self.output_path, "rb") as file:
+            self.assertEqual(file.read(), b"\xff" + self.base[1:])
+
+    def test_exception_removes_output(self) -> None:
+        with self.assertRaises(ValueError):
+            with RomWriter.fromMappedCopy(self.base, self.output_path) as rom_writer:
+                rom_writer.writeBytes(0, b"\xff")
+                raise ValueError("bad seed data")
+        self.assertFalse(os.path.exists(self.output_path))
@@ -0,0 +1,144 @@
+"""
+stress check for the shared resources in `lazy`
+
+`TestStressLazy` runs it in a new process (so nothing else is loaded yet), if a base rom is configured.
+To run it with other numbers, from the Archipelago directory:
+    python -m worlds.cliffredux.test.test_stress_lazy --threads 32 --jobs 256
+
+Many threads start at the same time, half of them doing what `generate_output` does for a player
+(item rom data, seed IPS, .apcr) and half patching roms from the .apcr files,
+all with nothing loaded. Then every `Lazy` must have been made no more than once,
+and every patched rom must be the same as one patched with nothing else running.
+"""
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from ..lazy import all_lazy
+from ..patch_utils import GenData, ItemRomData, make_gen_data
+from ..rom import CliffReduxDeltaPatch, get_base_rom_path, make_seed_ips, write_rom_from_gen_data
+
+
+def _output(directory: str, player: int, job: int) -> str:
+    """ the output step of `generate_output` for a player with no locations - returns the .apcr path """
+    item_rom_data = ItemRomData(player, {player: f"Stress{player}"})
+    rom_name = bytearray(f"CRstress_{player}", "utf8")[:21]
+    rom_name.extend(b" " * (21 - len(rom_name)))
+    gen_data = GenData(item_rom_data.get_packed_data(), player, rom_name)
+    patch_file_name = os.path.join(directory, f"stress_P{player}_{job}{CliffReduxDeltaPatch.patch_file_ending}")
+    patch = CliffReduxDeltaPatch(patch_file_name,
+                                 player=player,
+                                 player_name=f"Stress{player}",
+                                 gen_data=make_gen_data(gen_data),
+                                 seed_ips=make_seed_ips(gen_data))
+    patch.write()
+    return patch_file_name
+
+
+def _patch(directory: str, apcr_path: str, job: int) -> str:
+    """
+    returns the md5 of the patched rom
+
+    (`CliffReduxDeltaPatch.patch` without the rom cache, so every job patches, and the user's cache isn't filled)
+    """
+    rom_path = os.path.join(directory, f"stress_{job}.sfc")
+    patch = CliffReduxDeltaPatch(apcr_path)
+    patch.read()
+    if job % 2:
+        seed_ips = patch.usable_seed_ips()
+        assert seed_ips, f"no seed IPS in {apcr_path}"
+        write_rom_from_gen_data(patch.gen_data, rom_path, seed_ips, use_cache=False)
+    else:  # without the seed IPS
+        write_rom_from_gen_data(patch.gen_data, rom_path, use_cache=False)
+    with open(rom_path, "rb") as file:
+        digest = hashlib.md5(file.read()).hexdigest()
+    os.unlink(rom_path)
+    return digest
+
+
+def run(threads: int, jobs: int, players: int) -> bool:
+    """ True if every `Lazy` was made no more than once and all the roms for a player are the same """
+    # some are loaded when the modules are imported
+    loaded_at_import = {lazy.name for lazy in all_lazy() if lazy.ready}
+
+    # switch threads often, to get them into each other's initialization
+    sys.setswitchinterval(1e-6)
+    starters = min(threads, jobs)
+    start_line = threading.Barrier(starters)
+
+    with tempfile.TemporaryDirectory() as directory:
+        apcr_paths: Dict[int, str] = {}
+        apcr_paths_lock = threading.Lock()
+
+        def job(n: int) -> Tuple[str, float]:
+            if n < starters:
+                start_line.wait()
+            start = time.perf_counter()
+            player = n % players + 1
+            if n // players % 2 == 0 or player not in apcr_paths:
+                path = _output(directory, player, n)
+                with apcr_paths_lock:
+                    apcr_paths.setdefault(player, path)
+                return "", time.perf_counter() - start
+            return _patch(directory, apcr_paths[player], n), time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            results = list(executor.map(job, range(jobs)))
+        seconds = time.perf_counter() - start
+
+        ok = True
+        print(f"{jobs} jobs on {threads} threads in {seconds:.2f} s "
+              f"(slowest {max(job_seconds for _, job_seconds in results):.2f} s)")
+        for lazy in all_lazy():
+            note = " (at import)" if lazy.name in loaded_at_import else ""
+            print(f"  {lazy.name}: made {lazy.loads} times{note}")
+            if lazy.loads > 1:
+                ok = False
+
+        # same rom for each player, with or without the threads
+        digests: Dict[int, List[str]] = {}
+        for n, (digest, _) in enumerate(results):
+            if digest:
+                digests.setdefault(n % players + 1, []).append(digest)
+        for player, player_digests in sorted(digests.items()):
+            expected = _patch(directory, apcr_paths[player], 0)
+            mismatched = sum(digest != expected for digest in player_digests)
+            print(f"  player {player}: {len(player_digests)} roms, {mismatched} different")
+            if mismatched:
+                ok = False
+    return ok
+
+
+class TestStressLazy(unittest.TestCase):
+    def test_stress_lazy(self) -> None:
+        if not os.path.exists(get_base_rom_path()):
+            self.skipTest("no base rom configured")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        result = subprocess.run([sys.executable, "-m", __name__, "--threads", "16", "--jobs", "64"],
+                                env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cliffhanger Redux shared resource stress check")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--jobs", type=int, default=256)
+    parser.add_argument("--players", type=int, default=4)
+    args = parser.parse_args()
+
+    ok = run(args.threads, args.jobs, args.players)
+    print("ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()